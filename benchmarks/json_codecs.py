@@ -0,0 +1,44 @@
+"""
+Compare the JSON backends pydisgit can use on webhook payloads.
+
+Run with ``poetry run python benchmarks/json_codecs.py [payload.json ...]``. With no
+arguments, every payload in ``benchmarks/payloads`` is used.
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+from pydisgit.codec import available_codecs, select_codec
+
+PAYLOADS = Path(__file__).parent / "payloads"
+
+
+def measure(func, arg) -> float:
+  """
+  Best time per call in microseconds
+  """
+  timer = timeit.Timer(lambda: func(arg))
+  number, _ = timer.autorange()
+  return min(timer.repeat(5, number)) / number * 1e6
+
+
+def main(paths: list[Path]) -> None:
+  codecs = [select_codec(name) for name in available_codecs()]
+  print(f"{'payload':<24} {'size':>9} {'backend':<8} {'decode µs':>10} {'encode µs':>10} {'speedup':>8}")
+  for path in paths:
+    raw = path.read_bytes()
+    baseline = None
+    for codec in reversed(codecs):  # stdlib first
+      obj = codec.loads(raw)
+      decode = measure(codec.loads, raw)
+      encode = measure(codec.dumps, obj)
+      if baseline is None:
+        baseline = decode + encode
+      print(
+        f"{path.stem:<24} {len(raw):>9} {codec.name:<8} {decode:>10.1f} {encode:>10.1f} {baseline / (decode + encode):>7.1f}x"
+      )
+
+
+if __name__ == "__main__":
+  main([Path(p) for p in sys.argv[1:]] or sorted(PAYLOADS.glob("*.json")))
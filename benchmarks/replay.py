@@ -0,0 +1,269 @@
+"""
+Replay captured webhook payloads through the whole app and time them.
+
+Every payload in ``benchmarks/payloads`` is sent to the ASGI app in-process,
+signed, through the HMAC middleware, routing and rendering, with Discord
+replaced by a stub that accepts everything. A few pathological payloads are
+built from the corpus on top of that, to keep the slow paths honest.
+
+Payload files are named after their event, optionally with a variant, such
+as ``push.json`` or ``push.tag.json``.
+
+Run with ``poetry run python benchmarks/replay.py``. Useful options:
+
+- ``--save baseline.json`` to record results
+- ``--compare baseline.json`` to show the change against recorded results,
+  failing if any case got slower than ``--threshold`` allows
+- ``-k push`` to only run cases with ``push`` in their name
+"""
+
+import argparse
+import asyncio
+import copy
+import hmac
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+PAYLOADS = Path(__file__).parent / "payloads"
+SECRET = "benchmark-secret"
+
+# the app is configured from the environment on import
+os.environ["PYDISGIT_GITHUB_WEBHOOK_SECRET"] = SECRET
+# no connection to Discord, so that the timings don't depend on the network
+os.environ["PYDISGIT_HTTP_WARMUP"] = "false"
+
+import httpx  # noqa: E402
+
+from pydisgit import app  # noqa: E402
+from pydisgit.discord import DiscordClient  # noqa: E402
+
+
+class Case(NamedTuple):
+  name: str
+  event: str
+  body: bytes
+  content_type: str = "application/json"
+
+
+class Result(NamedTuple):
+  name: str
+  size: int
+  status: int
+  throughput: float
+  p50: float
+  p99: float
+  peak_kib: float
+
+
+def _load(name: str) -> dict:
+  return json.loads((PAYLOADS / f"{name}.json").read_bytes())
+
+
+def _huge_push() -> dict:
+  payload = _load("push")
+  commit = payload["commits"][0]
+  commits = []
+  for i in range(2000):
+    c = copy.deepcopy(commit)
+    c["id"] = f"{i:040x}"
+    c["message"] = f"Commit number {i} in a very large push\n\nWith a body that nobody will ever read."
+    commits.append(c)
+  payload["commits"] = commits
+  payload["head_commit"] = commits[-1]
+  return payload
+
+
+def _huge_pull_request() -> dict:
+  payload = _load("pull_request")
+  paragraph = "This pull request description goes on, and on, and on. <!-- with a hidden comment --> "
+  payload["pull_request"]["body"] = (paragraph * (60_000 // len(paragraph) + 1))[:60_000]
+  return payload
+
+
+def _huge_gollum() -> dict:
+  payload = _load("gollum")
+  page = payload["pages"][0]
+  pages = []
+  for i in range(200):
+    p = dict(page, page_name=f"Page-{i}", title=f"Page {i}", html_url=f"{page['html_url']}-{i}")
+    pages.append(p)
+  payload["pages"] = pages
+  return payload
+
+
+# built from the corpus rather than checked in, since they are large
+PATHOLOGICAL: dict[str, tuple[str, Callable[[], dict]]] = {
+  "push.2000-commits": ("push", _huge_push),
+  "pull_request.60k-body": ("pull_request", _huge_pull_request),
+  "gollum.200-pages": ("gollum", _huge_gollum),
+}
+
+
+def cases() -> Iterator[Case]:
+  for path in sorted(PAYLOADS.glob("*.json")):
+    yield Case(path.stem, path.stem.split(".")[0], path.read_bytes())
+
+  # form-encoded payloads take a different path through gh_hook
+  push = (PAYLOADS / "push.json").read_bytes()
+  yield Case("push.form", "push", urlencode({"payload": push}).encode(), "application/x-www-form-urlencoded")
+
+  for name, (event, build) in PATHOLOGICAL.items():
+    yield Case(name, event, json.dumps(build()).encode())
+
+
+def _scope(case: Case) -> dict:
+  signature = "sha256=" + hmac.new(SECRET.encode(), case.body, "sha256").hexdigest()
+  return {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "POST",
+    "scheme": "http",
+    "path": "/123456789012345678/benchmark-token",
+    "raw_path": b"/123456789012345678/benchmark-token",
+    "query_string": b"",
+    "root_path": "",
+    "server": ("127.0.0.1", 8000),
+    "client": ("127.0.0.1", 54321),
+    "headers": [
+      (b"host", b"localhost"),
+      (b"content-type", case.content_type.encode()),
+      (b"content-length", str(len(case.body)).encode()),
+      (b"x-github-event", case.event.encode()),
+      (b"x-hub-signature-256", signature.encode()),
+    ],
+  }
+
+
+async def _request(scope: dict, body: bytes) -> int:
+  """
+  Send a single request through the app, returning its status
+  """
+  sent = False
+  status = 0
+
+  async def receive() -> dict:
+    nonlocal sent
+    if not sent:
+      sent = True
+      return {"type": "http.request", "body": body, "more_body": False}
+    # nothing more to send, so just wait until the app is done with us
+    await asyncio.Event().wait()
+
+  async def send(message: dict) -> None:
+    nonlocal status
+    if message["type"] == "http.response.start":
+      status = message["status"]
+
+  await app.asgi_app(scope, receive, send)
+  return status
+
+
+async def run(case: Case, iterations: int, warmup: int) -> Result:
+  scope = _scope(case)
+  for _ in range(warmup):
+    status = await _request(scope, case.body)
+
+  timings = []
+  started = time.perf_counter()
+  for _ in range(iterations):
+    start = time.perf_counter()
+    status = await _request(scope, case.body)
+    timings.append(time.perf_counter() - start)
+  elapsed = time.perf_counter() - started
+
+  # allocations are measured separately, since tracing slows everything down
+  peaks = []
+  tracemalloc.start()
+  for _ in range(max(1, iterations // 10)):
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    await _request(scope, case.body)
+    _, peak = tracemalloc.get_traced_memory()
+    peaks.append(peak - before)
+  tracemalloc.stop()
+
+  quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+  return Result(
+    case.name,
+    len(case.body),
+    status,
+    iterations / elapsed,
+    quantiles[49] * 1e6,
+    quantiles[98] * 1e6,
+    statistics.median(peaks) / 1024,
+  )
+
+
+def _stub_discord(request: httpx.Request) -> httpx.Response:
+  return httpx.Response(204)
+
+
+async def run_all(selected: list[Case], iterations: int, warmup: int) -> list[Result]:
+  async with app.test_app():
+    stub = httpx.AsyncClient(transport=httpx.MockTransport(_stub_discord))
+    app.discord = DiscordClient(stub, app.rate_limiter, app.codec, app.config["DISCORD_API_BASE"])
+    try:
+      return [await run(case, iterations, warmup) for case in selected]
+    finally:
+      await stub.aclose()
+
+
+def report(results: list[Result], baseline: dict[str, dict], threshold: float) -> bool:
+  """
+  Print results, with the change in p50 from ``baseline`` if there is one.
+
+  Returns ``False`` if any case is slower than the threshold allows.
+  """
+  ok = True
+  print(
+    f"{'case':<34} {'size':>9} {'status':>6} {'req/s':>9} {'p50 µs':>9} {'p99 µs':>9} {'peak KiB':>9}"
+    + (f" {'Δ p50':>8}" if baseline else "")
+  )
+  for r in results:
+    line = f"{r.name:<34} {r.size:>9} {r.status:>6} {r.throughput:>9.0f} {r.p50:>9.1f} {r.p99:>9.1f} {r.peak_kib:>9.1f}"
+    previous = baseline.get(r.name)
+    if previous is not None:
+      change = r.p50 / previous["p50"] - 1
+      line += f" {change:>+7.1%}"
+      if change > threshold:
+        line += "  REGRESSED"
+        ok = False
+    print(line)
+  return ok
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("-n", "--iterations", type=int, default=200, help="timed requests per case")
+  parser.add_argument("--warmup", type=int, default=20, help="untimed requests per case before timing")
+  parser.add_argument("-k", "--filter", default="", help="only run cases whose name contains this")
+  parser.add_argument("--save", type=Path, help="write results to this file")
+  parser.add_argument("--compare", type=Path, help="compare with results saved by --save")
+  parser.add_argument(
+    "--threshold", type=float, default=0.2, help="fail if any p50 is slower than the baseline by this fraction"
+  )
+  args = parser.parse_args()
+
+  selected = [case for case in cases() if args.filter in case.name]
+  results = asyncio.run(run_all(selected, args.iterations, args.warmup))
+
+  baseline = json.loads(args.compare.read_text()) if args.compare else {}
+  ok = report(results, baseline, args.threshold)
+
+  if args.save:
+    args.save.write_text(json.dumps({r.name: r._asdict() for r in results}, indent=2) + "\n")
+
+  return 0 if ok else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Measure how long a cold start keeps the first webhook waiting.
+
+This mimics socket activation: a listening socket is created first and a
+request is queued on it, then hypercorn is started on that socket, and we
+time how long it takes for the request to be answered. A breakdown of the
+slowest packages to import, from ``python -X importtime``, is printed along with it.
+
+Run with ``poetry run python benchmarks/startup.py``. Useful options:
+
+- ``--budget-ms 800`` to change how long the median start may take before
+  this fails (default 1000)
+- ``-w 2`` to time hypercorn with that many worker processes, rather than
+  serving from its own process as the Docker image does
+- ``--app`` to start something other than ``pydisgit:create_app()``
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REQUEST = b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+
+
+def _environment() -> dict[str, str]:
+  # no connection to Discord, so that only our own start is measured
+  return dict(os.environ, PYDISGIT_HTTP_WARMUP="false")
+
+
+def first_response(app: str, workers: int) -> float:
+  """
+  Start hypercorn on a socket with a request already waiting, returning the seconds until it's answered
+  """
+  with tempfile.TemporaryDirectory() as directory:
+    path = str(Path(directory) / "pydisgit.sock")
+    listener = socket.socket(socket.AF_UNIX)
+    listener.bind(path)
+    listener.listen()
+
+    client = socket.socket(socket.AF_UNIX)
+    client.connect(path)
+    client.sendall(REQUEST)
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+      [
+        sys.executable,
+        "-m",
+        "hypercorn",
+        f"asgi:{app}",
+        "--bind",
+        f"fd://{listener.fileno()}",
+        "--workers",
+        str(workers),
+      ],
+      pass_fds=(listener.fileno(),),
+      env=_environment(),
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL,
+    )
+    try:
+      response = b""
+      while chunk := client.recv(4096):
+        response += chunk
+      elapsed = time.perf_counter() - started
+    finally:
+      server.terminate()
+      server.wait()
+      client.close()
+      listener.close()
+
+  if not response.startswith(b"HTTP/1.1 200"):
+    raise RuntimeError(f"Unexpected response from {app}: {response[:100]!r}")
+  return elapsed
+
+
+def slowest_imports(app: str, count: int) -> list[tuple[str, int]]:
+  """
+  The packages that take longest to import while loading ``app``, with the time spent in their own modules in µs
+  """
+  module, _, attribute = app.partition(":")
+  code = f"import sys; print('-- start', file=sys.stderr); import {module}; {module}.{attribute}"
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    env=_environment(),
+    capture_output=True,
+    text=True,
+    check=True,
+  )
+
+  packages: dict[str, int] = {}
+  started = False
+  for line in result.stderr.splitlines():
+    if line == "-- start":
+      started = True
+    elif started and line.startswith("import time:"):
+      own, _, name = line.removeprefix("import time:").split("|")
+      if own.strip().isdigit():
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+
+  return sorted(packages.items(), key=lambda p: p[1], reverse=True)[:count]
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("-n", "--iterations", type=int, default=5, help="cold starts to time")
+  parser.add_argument("--app", default="pydisgit:create_app()", help="the app to start, as given to hypercorn")
+  parser.add_argument(
+    "-w", "--workers", type=int, default=0, help="hypercorn workers, where 0 serves from hypercorn's own process"
+  )
+  parser.add_argument(
+    "--budget-ms", type=float, default=1000, help="fail if the median start takes longer than this, 0 for no limit"
+  )
+  parser.add_argument("--top", type=int, default=10, help="how many of the slowest packages to import to show")
+  args = parser.parse_args()
+
+  timings = [first_response(args.app, args.workers) * 1000 for _ in range(args.iterations)]
+  median = statistics.median(timings)
+  print(
+    f"first response after a cold start: median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms"
+  )
+
+  if args.top:
+    print()
+    print(f"{'slowest packages to import':<40} {'ms':>8}")
+    for name, micros in slowest_imports(args.app, args.top):
+      print(f"{name:<40} {micros / 1000:>8.1f}")
+
+  if args.budget_ms and median > args.budget_ms:
+    print(f"\nOver budget: {median:.0f} ms is more than {args.budget_ms:.0f} ms")
+    return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,100 +1,39 @@
-import pprint
+"""
+A GitHub webhook proxy for Discord.
 
-from httpx import AsyncClient
-from quart import Quart, Response, request
-from werkzeug.exceptions import BadRequest
+The app is built by ``create_app``, which is what hypercorn is pointed at, as
+``hypercorn 'pydisgit:create_app()'``. ``pydisgit.app`` is created the first
+time it's looked up. Either way, importing the package or its handlers on
+their own doesn't load the web framework or read any config.
+"""
 
-from .conf import BoundEnv, Config
-from .hmac import HmacVerifyMiddleware
+from typing import TYPE_CHECKING
 
-Quart.__annotations__["http_client"] = AsyncClient
-app = Quart(__name__)
+if TYPE_CHECKING:
+  from quart import Quart
 
+__all__ = ["app", "create_app", "run_dev"]
 
-# config setup
-app.config.from_object(Config)
-app.config.from_prefixed_env(prefix="PYDISGIT")
 
-bound = BoundEnv(app.config, app.logger)
-app.asgi_app = HmacVerifyMiddleware(app.asgi_app, bound.github_webhook_secret)
-
-from .handlers import router as free_handler_router  # noqa: E402
-
-handler_router = free_handler_router.bind(bound, app.logger)
-
-# http client
-
-
-@app.before_serving
-async def setup_httpclient():
-  app.http_client = AsyncClient(headers={"User-Agent": "pydisgit (kyori flavour)"})
-
-
-@app.after_serving
-async def teardown_httpclient():
-  await app.http_client.aclose()
-
-
-@app.get("/")
-async def hello() -> str:
+def create_app() -> "Quart":
   """
-  root handler
+  Create a new app, configured from the environment
   """
-  return "begone foul beast", 400
-
+  from .server import create_app
 
-@app.post("/<hook_id>/<token>")
-async def gh_hook(hook_id: str, token: str) -> dict:
-  event = request.headers["X-GitHub-Event"]
-  if not event or not request.content_type:
-    raise BadRequest("No event or content type")
+  return create_app()
 
-  # if (!(await validateRequest(request, env.githubWebhookSecret))) {
-  #  return new Response('Invalid secret', { status: 403 });
-  # }
 
-  if "application/json" in request.content_type:
-    json = await request.json
-  elif "application/x-www-form-urlencoded" in request.content_type:
-    json = json.loads((await request.form)["payload"])
-  else:
-    raise BadRequest(f"Unknown content type {request.content_type}")
-
-  embed = handler_router.process_request(event, json)
-  if not embed:
-    return "Webhook NO-OP", 200
-
-  if app.config["DEBUG"]:
-    pprint.pprint(embed)
-    pass
-    # embed = await bound.buildDebugPaste(embed)
-
-  http: AsyncClient = app.http_client
-
-  result = await http.post(f"https://discord.com/api/webhooks/{hook_id}/{token}", json=embed)
-
-  if result.status_code in (200, 204):
-    result_text = "".join([await a async for a in result.aiter_text()])
-    return {"message": f"We won! Webhook {hook_id} executed with token {token} :3, response: {result_text}"}, 200
-  else:
-    return Response(
-      response=await result.aread(),
-      status=result.status_code,
-      content_type=result.headers["content-type"],
-      headers=result.headers,
-    )
-
-
-@app.get("/health")
-async def health_check() -> str:
-  """
-  simple aliveness check
-  """
-  return "OK"
+def __getattr__(name: str):
+  if name == "app":
+    global app
+    app = create_app()
+    return app
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def run_dev() -> None:
   """
   Run a development instance of the app
   """
-  app.run()
+  create_app().run()
@@ -0,0 +1,246 @@
+"""
+Aggregation of check run completions into one summary message per commit.
+
+A matrix build can complete dozens of check runs for a single commit, each
+of which would otherwise be a message of its own. Instead, completions for
+a commit are gathered for a window, or until its check suite completes, and
+sent as one embed listing which checks passed, failed and were skipped.
+
+With ``edit`` set, later completions for the same commit edit that message
+in place rather than sending another.
+"""
+
+import asyncio
+from collections import OrderedDict
+from logging import Logger
+from typing import NamedTuple, Optional
+
+import msgspec
+from httpx import Response
+
+from .discord import DiscordClient
+from .handlers import check_target
+from .models import CheckRun, Repository, User
+from .webhook import EmbedBody, Field, PayloadError
+
+_FAILED = frozenset({"failure", "cancelled", "timed_out", "action_required"})
+# checks kept for each commit, any more are left out of its summary
+_MAX_RUNS = 500
+
+
+class CheckRunCompleted(msgspec.Struct, gc=False):
+  check_run: CheckRun
+  repository: Repository
+  sender: User
+
+
+class _SuiteHead(msgspec.Struct, gc=False):
+  head_sha: str
+
+
+class _CheckSuiteEvent(msgspec.Struct, gc=False):
+  check_suite: _SuiteHead
+  repository: Repository
+  action: Optional[str] = None
+
+
+_run_decoder = msgspec.json.Decoder(CheckRunCompleted)
+_suite_decoder = msgspec.json.Decoder(_CheckSuiteEvent)
+
+
+class _Check(NamedTuple):
+  conclusion: Optional[str]
+  html_url: str
+
+
+class _Suite:
+  """
+  Check runs seen so far for one commit and webhook
+  """
+
+  __slots__ = ("checks", "lock", "message_id", "repository", "sender", "sent", "target", "timer")
+
+  def __init__(self, repository: Repository, target: str, sender: User):
+    self.repository = repository
+    self.target = target
+    self.sender = sender
+    self.checks: dict[str, _Check] = {}
+    # names of checks already included in a message
+    self.sent: set[str] = set()
+    self.message_id: Optional[str] = None
+    self.timer: Optional[asyncio.TimerHandle] = None
+    self.lock = asyncio.Lock()
+
+
+type _Key = tuple[str, str, str, str]
+
+
+def decode_check_run(data: bytes) -> CheckRunCompleted:
+  try:
+    return _run_decoder.decode(data)
+  except msgspec.ValidationError as e:
+    raise PayloadError(f"Payload has an invalid check run: {e}") from e
+  except msgspec.DecodeError as e:
+    raise PayloadError(f"Payload is not valid JSON: {e}") from e
+
+
+class CheckRunAggregator:
+  """
+  Gathers check runs by commit for ``window`` seconds before sending a summary, keeping at most ``max_suites``
+  commits at once. Once there are too many, the least recently updated are sent early and forgotten.
+  """
+
+  __suites: OrderedDict[_Key, _Suite]
+  __pending: set[asyncio.Task]
+
+  def __init__(self, discord: DiscordClient, logger: Logger, window: float, edit: bool, max_suites: int):
+    self.__discord = discord
+    self.__logger = logger
+    self.__window = window
+    self.__edit = edit
+    self.__max_suites = max_suites
+    self.__suites = OrderedDict()
+    self.__pending = set()
+
+  def add(self, hook_id: str, token: str, completed: CheckRunCompleted) -> None:
+    """
+    Count a completed check run towards the summary for its commit
+    """
+    check_run = completed.check_run
+    key = (hook_id, token, completed.repository.full_name, check_run.check_suite.head_sha)
+    suite = self.__suites.get(key)
+    if suite is None:
+      while len(self.__suites) >= self.__max_suites:
+        self.__complete(next(iter(self.__suites)))
+      target = check_target(check_run, completed.repository) or check_run.check_suite.head_sha[:7]
+      suite = self.__suites[key] = _Suite(completed.repository, target, completed.sender)
+    else:
+      self.__suites.move_to_end(key)
+
+    if check_run.name in suite.checks or len(suite.checks) < _MAX_RUNS:
+      suite.checks[check_run.name] = _Check(check_run.conclusion, check_run.html_url)
+      # a check that ran again is reported again
+      suite.sent.discard(check_run.name)
+    suite.sender = completed.sender
+    if suite.timer is None:
+      suite.timer = asyncio.get_running_loop().call_later(self.__window, self.__flush, key)
+
+  def suite_event(self, data: bytes) -> None:
+    """
+    Handle a ``check_suite`` event, sending the summary for its commit right away once the suite has completed
+    """
+    try:
+      event = _suite_decoder.decode(data)
+    except msgspec.ValidationError as e:
+      raise PayloadError(f"Payload has an invalid check suite: {e}") from e
+    except msgspec.DecodeError as e:
+      raise PayloadError(f"Payload is not valid JSON: {e}") from e
+
+    if event.action != "completed":
+      return
+    for key in [k for k in self.__suites if k[2:] == (event.repository.full_name, event.check_suite.head_sha)]:
+      self.__complete(key)
+
+  async def stop(self) -> None:
+    """
+    Send every summary that's waiting, and wait for them to be sent
+    """
+    for key in list(self.__suites):
+      self.__complete(key)
+    await asyncio.gather(*self.__pending, return_exceptions=True)
+
+  def __complete(self, key: _Key) -> None:
+    self.__flush(key)
+    del self.__suites[key]
+
+  def __flush(self, key: _Key) -> None:
+    suite = self.__suites.get(key)
+    if suite is None or suite.timer is None:
+      return
+
+    suite.timer.cancel()
+    suite.timer = None
+    task = asyncio.create_task(self.__send(key, suite))
+    self.__pending.add(task)
+    task.add_done_callback(self.__pending.discard)
+
+  async def __send(self, key: _Key, suite: _Suite) -> None:
+    hook_id, token, _, head_sha = key
+    async with suite.lock:
+      if self.__edit:
+        checks = dict(suite.checks)
+      else:
+        checks = {name: check for name, check in suite.checks.items() if name not in suite.sent}
+      if not checks:
+        return
+
+      try:
+        sent = await self.__deliver(hook_id, token, suite, self.__summary(suite, head_sha, checks))
+      except Exception:
+        # nothing waits on this task, so the error has to be reported here
+        self.__logger.exception("Failed to send check summary for %s to webhook %s", head_sha, hook_id)
+        return
+      if sent:
+        # leave out checks that ran again while this summary was being sent
+        suite.sent.update(name for name, check in checks.items() if suite.checks.get(name) is check)
+
+  async def __deliver(self, hook_id: str, token: str, suite: _Suite, body: dict) -> bool:
+    """
+    Send or edit the summary message for a suite, returning whether Discord accepted it
+    """
+    if suite.message_id is not None:
+      response = await self.__discord.edit_message(hook_id, token, suite.message_id, body)
+      if response.status_code != 404:
+        self.__log_failure(response, hook_id)
+        return response.is_success
+      # the message was deleted, so send a new one
+      suite.message_id = None
+
+    response = await self.__discord.execute_webhook(hook_id, token, body, wait=self.__edit)
+    self.__log_failure(response, hook_id)
+    if self.__edit and response.is_success:
+      suite.message_id = response.json().get("id")
+    return response.is_success
+
+  def __log_failure(self, response: Response, hook_id: str) -> None:
+    if not response.is_success:
+      self.__logger.warning(
+        "Discord rejected check summary for webhook %s with status %d: %s",
+        hook_id,
+        response.status_code,
+        response.text,
+      )
+
+  def __summary(self, suite: _Suite, head_sha: str, checks: dict[str, _Check]) -> dict:
+    passed, failed, skipped = [], [], []
+    for name, check in checks.items():
+      if check.conclusion == "success":
+        passed.append(name)
+      elif check.conclusion in _FAILED:
+        failed.append(f"[{name}]({check.html_url})")
+      else:
+        skipped.append(name)
+
+    if failed:
+      status, color = "failed", 0xFF3B3B
+    elif not skipped:
+      status, color = "passed", 0x00B32A
+    else:
+      status, color = "finished", 0xAAAAAA
+
+    fields = []
+    if failed:
+      fields.append(Field("Failed", "\n".join(failed), False))
+    if passed:
+      fields.append(Field("Passed", ", ".join(passed), False))
+    if skipped:
+      fields.append(Field("Skipped", ", ".join(skipped), False))
+
+    return EmbedBody(
+      f"[{suite.repository.full_name}] Checks {status} on {suite.target}",
+      f"{suite.repository.html_url}/commit/{head_sha}",
+      suite.sender,
+      color,
+      f"{len(passed)} passed, {len(failed)} failed, {len(skipped)} skipped",
+      fields=fields,
+    ).to_json()
@@ -0,0 +1,104 @@
+"""
+Coalescing of bursts of messages into multi-embed deliveries
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from logging import Logger
+
+from .delivery import Delivery
+from .webhook import MAX_EMBEDS, MAX_MESSAGE_LENGTH, embed_length
+
+
+class _Batch:
+  """
+  Embeds collected for a single webhook during the current window
+  """
+
+  __slots__ = ("embeds", "length", "spool_ids", "timer")
+
+  def __init__(self, timer: asyncio.TimerHandle):
+    self.embeds: list[dict] = []
+    self.spool_ids: list[int] = []
+    self.length = 0
+    self.timer = timer
+
+
+class Coalescer:
+  """
+  Holds messages for a webhook for a short window, merging every embed that
+  arrives in that time into as few Discord messages as possible.
+  """
+
+  __batches: dict[tuple[str, str], _Batch]
+  __pending: set[asyncio.Task]
+
+  def __init__(
+    self, sink: Callable[[Delivery], Awaitable[None]], logger: Logger, window: float, max_pending: int
+  ) -> None:
+    self.__sink = sink
+    self.__logger = logger
+    self.__window = window
+    self.__max_pending = max_pending
+    self.__batches = {}
+    self.__pending = set()
+    self.__buffered = 0
+
+  def submit(self, delivery: Delivery) -> bool:
+    """
+    Add a delivery to the current window for its webhook, returning ``False`` if too many are pending
+    """
+    if self.__buffered + len(self.__pending) >= self.__max_pending:
+      self.__logger.warning("Too many messages pending, rejecting message for webhook %s", delivery.hook_id)
+      return False
+
+    key = (delivery.hook_id, delivery.token)
+    body = delivery.body
+    if body.keys() != {"embeds"}:
+      # we can only merge plain embed messages, but anything else still has to stay in order
+      self.__flush(key)
+      self.__dispatch(delivery)
+      return True
+
+    embeds = body["embeds"]
+    length = sum(embed_length(e) for e in embeds)
+
+    batch = self.__batches.get(key)
+    if batch and (len(batch.embeds) + len(embeds) > MAX_EMBEDS or batch.length + length > MAX_MESSAGE_LENGTH):
+      self.__flush(key)
+      batch = None
+
+    if batch is None:
+      batch = self.__batches[key] = _Batch(asyncio.get_running_loop().call_later(self.__window, self.__flush, key))
+
+    batch.embeds.extend(embeds)
+    batch.spool_ids.extend(delivery.spool_ids)
+    batch.length += length
+    self.__buffered += len(embeds)
+    if len(batch.embeds) >= MAX_EMBEDS:
+      self.__flush(key)
+
+    return True
+
+  async def stop(self) -> None:
+    """
+    Send every open batch immediately, and wait for in-flight deliveries
+    """
+    for key in list(self.__batches):
+      self.__flush(key)
+    await asyncio.gather(*self.__pending, return_exceptions=True)
+
+  def __flush(self, key: tuple[str, str]) -> None:
+    batch = self.__batches.pop(key, None)
+    if batch is None:
+      return
+
+    batch.timer.cancel()
+    self.__buffered -= len(batch.embeds)
+    self.__logger.debug("Sending %d coalesced embeds to webhook %s", len(batch.embeds), key[0])
+    self.__dispatch(Delivery(key[0], key[1], {"embeds": batch.embeds}, tuple(batch.spool_ids)))
+
+  def __dispatch(self, delivery: Delivery) -> None:
+    task = asyncio.create_task(self.__sink(delivery))
+    self.__pending.add(task)
+    task.add_done_callback(self.__pending.discard)
@@ -0,0 +1,83 @@
+"""
+Pluggable JSON encoding and decoding
+"""
+
+import importlib.util
+import json
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+
+class JsonCodec(NamedTuple):
+  """
+  A JSON implementation, decoding from bytes and encoding to UTF-8 bytes.
+
+  ``loads`` raises a ``ValueError`` on malformed input, whatever the backend.
+  """
+
+  name: str
+  loads: Callable[[bytes | str], Any]
+  dumps: Callable[[Any], bytes]
+
+
+def _orjson() -> JsonCodec:
+  import orjson
+
+  return JsonCodec("orjson", orjson.loads, orjson.dumps)
+
+
+def _msgspec() -> JsonCodec:
+  import msgspec
+
+  decoder = msgspec.json.Decoder()
+
+  def loads(data: bytes | str) -> Any:
+    try:
+      return decoder.decode(data)
+    except msgspec.DecodeError as e:
+      raise ValueError(str(e)) from e
+
+  return JsonCodec("msgspec", loads, msgspec.json.Encoder().encode)
+
+
+def _stdlib() -> JsonCodec:
+  decoder = json.JSONDecoder()
+  encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+  def loads(data: bytes | str) -> Any:
+    if not isinstance(data, str):
+      data = data.decode()
+    return decoder.decode(data)
+
+  def dumps(obj: Any) -> bytes:
+    return encoder.encode(obj).encode()
+
+  return JsonCodec("json", loads, dumps)
+
+
+# in order of preference
+_BACKENDS: dict[str, Callable[[], JsonCodec]] = {
+  "orjson": _orjson,
+  "msgspec": _msgspec,
+  "json": _stdlib,
+}
+
+
+def available_codecs() -> list[str]:
+  """
+  Names of every backend that can be used in this environment, fastest first
+  """
+  return [name for name in _BACKENDS if importlib.util.find_spec(name) is not None]
+
+
+def select_codec(preference: str = "auto") -> JsonCodec:
+  """
+  Get a codec by name, or the fastest one installed for ``auto``
+  """
+  if preference == "auto":
+    preference = available_codecs()[0]
+
+  if preference not in _BACKENDS:
+    raise ValueError(f"Unknown JSON backend '{preference}', expected one of {', '.join(_BACKENDS)} or auto")
+
+  return _BACKENDS[preference]()
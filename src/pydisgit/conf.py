@@ -2,8 +2,12 @@
 Configuration for pydisgit
 """
 
+import fnmatch
+import json
 import re
-from typing import Optional
+from collections.abc import Iterable
+from functools import lru_cache
+from typing import Any, Optional
 
 
 class Config:
@@ -15,47 +19,196 @@ class Config:
   IGNORED_BRANCHES: str = ""
   IGNORED_USERS: str = ""
   IGNORED_PAYLOADS: str = ""
+  # extra ignores for an organization or repository, see IgnoreRules.parse
+  SCOPED_IGNORES: Optional[dict[str, dict[str, Any]]] = None
+
+  # GitHub caps webhook payloads at 25 MB
+  MAX_BODY_SIZE: int = 25 * 1024 * 1024
+  JSON_BACKEND: str = "auto"
+  # render payloads of at least RENDER_POOL_THRESHOLD bytes in a "process" or "thread" pool
+  RENDER_POOL: Optional[str] = None
+  RENDER_WORKERS: int = 2
+  RENDER_POOL_THRESHOLD: int = 256 * 1024
+
+  # delivery
+  DISCORD_API_BASE: str = "https://discord.com/api"
+  DISCORD_MAX_RETRIES: int = 5
+  DELIVERY_QUEUE: bool = False
+  DELIVERY_QUEUE_SIZE: int = 1000
+  DELIVERY_WORKERS: int = 4
+  COALESCE_WINDOW_MS: int = 0
+  SPOOL_DIR: Optional[str] = None
+  SPOOL_COMMIT_INTERVAL_MS: int = 5
+  SPOOL_BATCH_SIZE: int = 512
+  # how long a worker holds spooled messages for without renewing, in seconds
+  SPOOL_LEASE: float = 60.0
+  # responses remembered by X-GitHub-Delivery, to answer redeliveries
+  DELIVERY_CACHE_SIZE: int = 10000
+  DELIVERY_CACHE_TTL: float = 24 * 60 * 60
+  DELIVERY_CACHE_FILE: Optional[str] = None
+  # a TOML file of named routes to several webhooks, see routes.py
+  ROUTES_FILE: Optional[str] = None
+  FANOUT_CONCURRENCY: int = 8
+  # per event, {"burst": messages, "window": seconds} for each webhook and repository, see throttle.py
+  THROTTLE: Optional[dict[str, dict[str, float]]] = None
+  THROTTLE_MAX_KEYS: int = 4096
+  # seconds to gather check run completions for a commit into one message, see checks.py
+  CHECK_RUN_WINDOW: float = 0
+  CHECK_RUN_EDIT: bool = False
+  CHECK_RUN_MAX_SUITES: int = 1024
+  # edit the message for a pull request or issue as it changes, rather than sending more, see messages.py
+  EDIT_IN_PLACE: bool = False
+  EDIT_IN_PLACE_FILE: Optional[str] = None
+  EDIT_IN_PLACE_TTL: float = 30 * 24 * 60 * 60
+  EDIT_IN_PLACE_MAX_ENTRIES: int = 100000
+
+  # connections to Discord, timeouts are in seconds
+  HTTP_MAX_CONNECTIONS: int = 20
+  HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+  HTTP_KEEPALIVE_EXPIRY: float = 60.0
+  HTTP_CONNECT_TIMEOUT: float = 5.0
+  HTTP_READ_TIMEOUT: float = 15.0
+  HTTP_WRITE_TIMEOUT: float = 10.0
+  HTTP_POOL_TIMEOUT: float = 10.0
+  HTTP2: bool = False
+  HTTP_WARMUP: bool = True
+
+  # a directory for state shared between worker processes
+  SHARED_STATE_DIR: Optional[str] = None
+
+  # observability
+  METRICS: bool = True
 
   # secrets
   PASTE_GG_API_KEY: Optional[str] = None
   GITHUB_WEBHOOK_SECRET: Optional[str] = None
 
 
+def _split(value: str | Iterable[str] | None) -> frozenset[str]:
+  if not value:
+    return frozenset()
+  if isinstance(value, str):
+    value = value.split(",")
+  return frozenset(v for v in (v.strip() for v in value) if v)
+
+
+class IgnoreRules:
+  """
+  A compiled set of users, branches and payloads to ignore
+  """
+
+  __slots__ = ("__branch_globs", "__branch_matchers", "__branch_regexes", "branches", "payloads", "users")
+
+  def __init__(
+    self,
+    users: frozenset[str],
+    branches: frozenset[str],
+    branch_regexes: tuple[str, ...],
+    branch_globs: frozenset[str],
+    payloads: frozenset[str],
+  ):
+    self.users = users
+    self.branches = branches
+    self.payloads = payloads
+    self.__branch_regexes = branch_regexes
+    self.__branch_globs = branch_globs
+    # configured regexes may use global flags or numbered groups, so each is compiled on its own,
+    # while the globs are translated by fnmatch and can safely be matched in a single pass
+    matchers = [re.compile(r) for r in branch_regexes]
+    if branch_globs:
+      matchers.append(re.compile("|".join(fnmatch.translate(g) for g in sorted(branch_globs))))
+    self.__branch_matchers = tuple(matchers)
+
+  @classmethod
+  def parse(cls, users=None, branches=None, branch_regex: Optional[str] = None, payloads=None) -> "IgnoreRules":
+    """
+    Parse rules from config values. Lists may be given as comma separated strings,
+    and any branch containing glob characters (``*?[``) is matched as a glob.
+    """
+    branch_names = _split(branches)
+    globs = frozenset(b for b in branch_names if any(c in b for c in "*?["))
+    regexes = (branch_regex,) if branch_regex else ()
+
+    return cls(_split(users), branch_names - globs, regexes, globs, _split(payloads))
+
+  def merge(self, other: "IgnoreRules") -> "IgnoreRules":
+    return IgnoreRules(
+      self.users | other.users,
+      self.branches | other.branches,
+      self.__branch_regexes + tuple(r for r in other.__branch_regexes if r not in self.__branch_regexes),
+      self.__branch_globs | other.__branch_globs,
+      self.payloads | other.payloads,
+    )
+
+  def ignores_branch(self, branch: str) -> bool:
+    return branch in self.branches or any(m.match(branch) is not None for m in self.__branch_matchers)
+
+  def __repr__(self) -> str:
+    return (
+      f"IgnoreRules(users={sorted(self.users)}, branches={sorted(self.branches)}, "
+      f"branch_regexes={list(self.__branch_regexes)}, branch_globs={sorted(self.__branch_globs)}, "
+      f"payloads={sorted(self.payloads)})"
+    )
+
+
 class BoundEnv:
   """
   Parsed + bound environment
   """
 
-  __ignored_branch_pattern: re.Pattern
-  __ignored_branches: list[str]
-  __ignored_users: list[str]
-  __ignored_payloads: list[str]
+  __ignores: IgnoreRules
+  __scoped_ignores: dict[str, IgnoreRules]
   __pastegg_api_key: str
   __github_webhook_secret: str
 
   def __init__(self, env, logger):
-    self.__ignored_branch_pattern = re.compile(env["IGNORED_BRANCH_REGEX"]) if "IGNORED_BRANCH_REGEX" in env else None
-    self.__ignored_branches = env["IGNORED_BRANCHES"].split(",")
-    self.__ignored_users = env["IGNORED_USERS"].split(",")
-    self.__ignored_payloads = env["IGNORED_PAYLOADS"].split(",")
+    self.__ignores = IgnoreRules.parse(
+      env["IGNORED_USERS"], env["IGNORED_BRANCHES"], env["IGNORED_BRANCH_REGEX"], env["IGNORED_PAYLOADS"]
+    )
+
+    scoped = env.get("SCOPED_IGNORES") or {}
+    if isinstance(scoped, str):
+      scoped = json.loads(scoped)
+    self.__scoped_ignores = {
+      scope: IgnoreRules.parse(
+        rules.get("users"), rules.get("branches"), rules.get("branch_regex"), rules.get("payloads")
+      )
+      for scope, rules in scoped.items()
+    }
+    self.__rules_for_repo = lru_cache(maxsize=2048)(self.__resolve_rules)
+
     self.__pastegg_api_key = env["PASTE_GG_API_KEY"]
     self.__github_webhook_secret = env["GITHUB_WEBHOOK_SECRET"]
 
-    logger.info("Ignored branch pattern: %s", self.__ignored_branch_pattern)
-    logger.info("Ignored branches: %s", self.__ignored_branches)
-    logger.info("Ignored users: %s", self.__ignored_users)
-    logger.info("Ignored payloads: %s", self.__ignored_payloads)
+    logger.info("Ignoring: %s", self.__ignores)
+    for scope, rules in self.__scoped_ignores.items():
+      logger.info("Also ignoring in %s: %s", scope, rules)
 
-  def ignored_branch(self, branch: str) -> bool:
-    return (
-      self.__ignored_branch_pattern and self.__ignored_branch_pattern.match(branch)
-    ) or branch in self.__ignored_branches
+  def __resolve_rules(self, repository: str) -> IgnoreRules:
+    rules = self.__ignores
+    owner = repository.partition("/")[0]
+    for scope in (owner, repository):
+      if scope in self.__scoped_ignores:
+        rules = rules.merge(self.__scoped_ignores[scope])
+    return rules
+
+  def __rules(self, repository: Optional[str]) -> IgnoreRules:
+    if repository is None or not self.__scoped_ignores:
+      return self.__ignores
+    return self.__rules_for_repo(repository)
+
+  @property
+  def has_scoped_ignores(self) -> bool:
+    return bool(self.__scoped_ignores)
+
+  def ignored_branch(self, branch: str, repository: Optional[str] = None) -> bool:
+    return self.__rules(repository).ignores_branch(branch)
 
-  def ignored_user(self, user: str) -> bool:
-    return user in self.__ignored_users
+  def ignored_user(self, user: str, repository: Optional[str] = None) -> bool:
+    return user in self.__rules(repository).users
 
-  def ignored_payload(self, payload: str) -> bool:
-    return payload in self.__ignored_payloads
+  def ignored_payload(self, payload: str, repository: Optional[str] = None) -> bool:
+    return payload in self.__rules(repository).payloads
 
   @property
   def github_webhook_secret(self) -> str:
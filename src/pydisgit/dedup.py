@@ -0,0 +1,151 @@
+"""
+Caching of webhook responses by GitHub delivery, so redeliveries aren't posted twice
+"""
+
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+  key TEXT PRIMARY KEY,
+  outcome TEXT NOT NULL,
+  status INTEGER NOT NULL,
+  content_type TEXT NOT NULL,
+  body BLOB NOT NULL,
+  expires REAL NOT NULL
+)
+"""
+
+# how many writes between sweeps of expired entries from the database
+_PRUNE_INTERVAL = 256
+
+
+class CachedResponse(NamedTuple):
+  """
+  What we answered GitHub with for a delivery, and what became of it
+  """
+
+  outcome: str
+  status: int
+  content_type: str
+  body: bytes
+
+
+class DeliveryCache:
+  """
+  Bounded in-memory cache of responses, by delivery, that expire after ``ttl`` seconds.
+
+  The least recently used entries are dropped once there are more than ``max_entries``.
+  """
+
+  __entries: OrderedDict[str, tuple[float, CachedResponse]]
+
+  def __init__(self, max_entries: int, ttl: float):
+    self._max_entries = max_entries
+    self._ttl = ttl
+    self.__entries = OrderedDict()
+
+  async def open(self) -> None:
+    pass
+
+  async def close(self) -> None:
+    pass
+
+  async def get(self, key: str) -> Optional[CachedResponse]:
+    entry = self.__entries.get(key)
+    if entry is None:
+      return None
+
+    expires, response = entry
+    if expires <= time.time():
+      del self.__entries[key]
+      return None
+
+    self.__entries.move_to_end(key)
+    return response
+
+  async def put(self, key: str, response: CachedResponse) -> None:
+    self.__entries[key] = (time.time() + self._ttl, response)
+    self.__entries.move_to_end(key)
+    while len(self.__entries) > self._max_entries:
+      self.__entries.popitem(last=False)
+
+
+class SqliteDeliveryCache(DeliveryCache):
+  """
+  Delivery cache in a SQLite database, which can be shared between processes.
+
+  Entries are dropped in order of expiry rather than use once there are too many.
+  All database access happens on a single dedicated thread.
+  """
+
+  def __init__(self, path: str | Path, logger: Logger, max_entries: int, ttl: float):
+    super().__init__(max_entries, ttl)
+    self.__path = Path(path)
+    self.__logger = logger
+    self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pydisgit-dedup")
+    self.__db: Optional[sqlite3.Connection] = None
+    self.__writes = 0
+
+  async def open(self) -> None:
+    await self.__run(self.__open)
+
+  async def close(self) -> None:
+    await self.__run(self.__db.close)
+    self.__executor.shutdown()
+
+  async def get(self, key: str) -> Optional[CachedResponse]:
+    try:
+      return await self.__run(self.__get, key)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to read delivery %s from the cache", key)
+      return None
+
+  async def put(self, key: str, response: CachedResponse) -> None:
+    self.__writes += 1
+    prune = self.__writes % _PRUNE_INTERVAL == 0
+    try:
+      await self.__run(self.__put, key, response, prune)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to write delivery %s to the cache", key)
+
+  async def __run(self, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+  # executor thread
+
+  def __open(self) -> None:
+    self.__path.parent.mkdir(parents=True, exist_ok=True)
+    self.__db = sqlite3.connect(self.__path, isolation_level=None, check_same_thread=False, timeout=5)
+    self.__db.execute("PRAGMA journal_mode=WAL")
+    # losing the last few entries in a crash only means a possible duplicate
+    self.__db.execute("PRAGMA synchronous=NORMAL")
+    self.__db.execute(_SCHEMA)
+
+  def __get(self, key: str) -> Optional[CachedResponse]:
+    row = self.__db.execute(
+      "SELECT outcome, status, content_type, body FROM deliveries WHERE key = ? AND expires > ?",
+      (key, time.time()),
+    ).fetchone()
+    return CachedResponse(*row) if row is not None else None
+
+  def __put(self, key: str, response: CachedResponse, prune: bool) -> None:
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN")
+      self.__db.execute(
+        "INSERT OR REPLACE INTO deliveries (key, outcome, status, content_type, body, expires) VALUES (?, ?, ?, ?, ?, ?)",
+        (key, *response, now + self._ttl),
+      )
+      if prune:
+        self.__db.execute("DELETE FROM deliveries WHERE expires <= ?", (now,))
+        self.__db.execute(
+          "DELETE FROM deliveries WHERE key IN (SELECT key FROM deliveries ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+          (self._max_entries,),
+        )
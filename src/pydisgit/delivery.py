@@ -0,0 +1,128 @@
+"""
+Asynchronous delivery of rendered messages to Discord
+"""
+
+import asyncio
+from logging import Logger
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+
+from httpx import HTTPError, Response
+
+from .discord import DiscordClient
+
+if TYPE_CHECKING:
+  from .spool import Spool
+
+
+class Delivery(NamedTuple):
+  """
+  A rendered message waiting to be sent to a Discord webhook
+  """
+
+  hook_id: str
+  token: str
+  body: Any
+  spool_ids: tuple[int, ...] = ()
+
+
+class DeliveryQueue:
+  """
+  Bounded queue of deliveries, drained by a pool of worker tasks.
+
+  This lets us acknowledge GitHub as soon as a message is rendered, rather than
+  waiting on a round-trip to Discord.
+  """
+
+  __queue: asyncio.Queue[Delivery]
+  __workers: list[asyncio.Task]
+
+  def __init__(self, discord: DiscordClient, spool: Optional["Spool"], logger: Logger, max_size: int, workers: int):
+    self.__discord = discord
+    self.__spool = spool
+    self.__logger = logger
+    self.__queue = asyncio.Queue(max_size)
+    self.__worker_count = workers
+    self.__workers = []
+
+  @property
+  def depth(self) -> int:
+    return self.__queue.qsize()
+
+  async def put(self, delivery: Delivery) -> None:
+    """
+    Queue a delivery, waiting for space if the queue is full
+    """
+    await self.__queue.put(delivery)
+
+  def submit(self, delivery: Delivery) -> bool:
+    """
+    Queue a delivery, returning ``False`` if the queue is full
+    """
+    try:
+      self.__queue.put_nowait(delivery)
+      return True
+    except asyncio.QueueFull:
+      self.__logger.warning("Delivery queue is full, rejecting message for webhook %s", delivery.hook_id)
+      return False
+
+  async def start(self) -> None:
+    self.__workers = [
+      asyncio.create_task(self.__worker(), name=f"pydisgit-delivery-{i}") for i in range(self.__worker_count)
+    ]
+
+  async def stop(self, grace_period: Optional[float] = 10) -> None:
+    """
+    Wait up to ``grace_period`` seconds for queued deliveries to be sent, then stop all workers
+    """
+    try:
+      async with asyncio.timeout(grace_period):
+        await self.__queue.join()
+    except TimeoutError:
+      self.__logger.warning("Timed out with %d deliveries still queued", self.depth)
+
+    for worker in self.__workers:
+      worker.cancel()
+    await asyncio.gather(*self.__workers, return_exceptions=True)
+    self.__workers = []
+
+  async def __worker(self) -> None:
+    while True:
+      delivery = await self.__queue.get()
+      try:
+        await deliver(self.__discord, self.__spool, self.__logger, delivery)
+      except Exception:
+        # keep the worker alive, the message stays spooled for replay to pick up
+        self.__logger.exception("Unexpected error delivering message to webhook %s", delivery.hook_id)
+      finally:
+        self.__queue.task_done()
+
+
+def is_settled(response: Response) -> bool:
+  """
+  Whether Discord has given a final answer for a message, such that sending it again would not help
+  """
+  return response.is_success or (response.is_client_error and response.status_code != 429)
+
+
+async def deliver(discord: DiscordClient, spool: Optional["Spool"], logger: Logger, delivery: Delivery) -> None:
+  """
+  Send a delivery to Discord, logging rather than raising on failure
+  """
+  try:
+    result = await discord.execute_webhook(delivery.hook_id, delivery.token, delivery.body)
+  except HTTPError:
+    logger.exception("Failed to deliver message to webhook %s", delivery.hook_id)
+    return
+
+  if spool is not None and is_settled(result):
+    spool.settle(delivery.spool_ids)
+
+  if result.is_success:
+    logger.debug("Delivered message to webhook %s", delivery.hook_id)
+  else:
+    logger.warning(
+      "Discord rejected message for webhook %s with status %d: %s",
+      delivery.hook_id,
+      result.status_code,
+      result.text,
+    )
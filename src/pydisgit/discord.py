@@ -0,0 +1,105 @@
+"""
+Client for the Discord webhook API
+"""
+
+from logging import Logger
+from time import perf_counter
+from typing import Any
+
+from httpx import AsyncClient, HTTPError, Response, TransportError
+
+from .codec import JsonCodec
+from .metrics import DISCORD_RESPONSES, HTTP_CONNECTIONS_OPENED, HTTP_POOL_WAIT_SECONDS, STAGE_SECONDS
+from .ratelimit import RateLimitScheduler
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# trace events marking that a request has been given a connection, new or reused
+_CONNECTION_ACQUIRED = ("connection.connect_tcp.started", "send_request_headers.started")
+
+
+async def _trace_connections(event: str, info: dict) -> None:
+  if event == "connection.connect_tcp.complete":
+    HTTP_CONNECTIONS_OPENED.inc()
+
+
+class DiscordClient:
+  """
+  Sends rendered messages to Discord webhooks.
+  """
+
+  def __init__(self, http: AsyncClient, scheduler: RateLimitScheduler, codec: JsonCodec, api_base: str):
+    self.__http = http
+    self.__scheduler = scheduler
+    self.__codec = codec
+    self.__api_base = api_base.rstrip("/")
+    self.__in_flight = 0
+
+  @property
+  def in_flight(self) -> int:
+    """
+    Requests currently waiting for or using a connection
+    """
+    return self.__in_flight
+
+  async def warm_up(self, logger: Logger) -> None:
+    """
+    Open a connection to Discord ahead of the first message, so it doesn't pay for the handshake
+    """
+    try:
+      await self.__http.head(self.__api_base, extensions={"trace": _trace_connections})
+    except HTTPError as e:
+      logger.warning("Could not warm up connection to Discord: %s", e)
+
+  def webhook_url(self, hook_id: str, token: str) -> str:
+    return f"{self.__api_base}/webhooks/{hook_id}/{token}"
+
+  async def execute_webhook(self, hook_id: str, token: str, body: Any, wait: bool = False) -> Response:
+    """
+    Execute the webhook identified by ``hook_id`` and ``token`` with a message body.
+
+    With ``wait``, Discord responds with the message it created, including its ``id``.
+    """
+    url = self.webhook_url(hook_id, token)
+    if wait:
+      url += "?wait=true"
+    return await self.__send("POST", hook_id, url, body)
+
+  async def edit_message(self, hook_id: str, token: str, message_id: str, body: Any) -> Response:
+    """
+    Replace the contents of a message previously sent through a webhook
+    """
+    url = f"{self.webhook_url(hook_id, token)}/messages/{message_id}"
+    # edits are limited separately from executions
+    return await self.__send("PATCH", f"{hook_id}/messages", url, body)
+
+  async def __send(self, method: str, bucket_key: str, url: str, body: Any) -> Response:
+    content = self.__codec.dumps(body)
+
+    async def request() -> Response:
+      start = perf_counter()
+      waiting = True
+
+      async def trace(event: str, info: dict) -> None:
+        nonlocal waiting
+        # the first sign of life from a connection means we have one from the pool
+        if waiting and event.endswith(_CONNECTION_ACQUIRED):
+          waiting = False
+          HTTP_POOL_WAIT_SECONDS.since(start)
+        await _trace_connections(event, info)
+
+      self.__in_flight += 1
+      try:
+        response = await self.__http.request(
+          method, url, content=content, headers=_JSON_HEADERS, extensions={"trace": trace}
+        )
+      except TransportError:
+        DISCORD_RESPONSES.inc("error")
+        raise
+      finally:
+        self.__in_flight -= 1
+        STAGE_SECONDS.since(start, "discord")
+      DISCORD_RESPONSES.inc(str(response.status_code))
+      return response
+
+    return await self.__scheduler.send(bucket_key, request)
@@ -0,0 +1,112 @@
+"""
+Extraction of the payload from form encoded webhook deliveries.
+
+GitHub can send deliveries as ``application/x-www-form-urlencoded``, with the
+JSON payload URL encoded in a single ``payload`` field. Rather than decoding
+the whole form, the body is scanned a chunk at a time and only that field is
+unquoted, so a large delivery is never held as more than its raw body and the
+payload it carries.
+"""
+
+from urllib.parse import unquote_to_bytes
+
+_FIELD = b"payload"
+# bodies that are already in memory are unquoted in pieces of this size, to keep the copies made small
+CHUNK_SIZE = 64 * 1024
+# a field name is only kept up to this length while it's split across chunks, any longer can't be "payload"
+_MAX_NAME = 64
+
+_NAME = 0
+_SKIP = 1
+_VALUE = 2
+_DONE = 3
+
+
+def _unquote(data: bytes) -> bytes:
+  return unquote_to_bytes(data.replace(b"+", b" "))
+
+
+class FormPayloadDecoder:
+  """
+  Decodes the first ``payload`` field of a form encoded body, fed to it in chunks of any size
+  """
+
+  def __init__(self):
+    self.__state = _NAME
+    self.__name = b""
+    # an escape sequence split across chunks
+    self.__pending = b""
+    self.__payload = bytearray()
+
+  @property
+  def done(self) -> bool:
+    """
+    Whether the whole payload has been read, so the rest of the body can be left alone
+    """
+    return self.__state == _DONE
+
+  def feed(self, chunk: bytes) -> None:
+    data = self.__pending + chunk if self.__pending else chunk
+    self.__pending = b""
+    pos = 0
+    end = len(data)
+    while pos < end and self.__state != _DONE:
+      if self.__state == _SKIP:
+        separator = data.find(b"&", pos)
+        if separator < 0:
+          return
+        self.__state = _NAME
+        pos = separator + 1
+      elif self.__state == _NAME:
+        equals = data.find(b"=", pos)
+        separator = data.find(b"&", pos)
+        if equals < 0 or 0 <= separator < equals:
+          if separator < 0:
+            self.__name = (self.__name + data[pos:])[: _MAX_NAME + 1]
+            return
+          # a field with no value
+          self.__name = b""
+          pos = separator + 1
+          continue
+
+        name = self.__name + data[pos:equals]
+        self.__name = b""
+        self.__state = _VALUE if _unquote(name) == _FIELD else _SKIP
+        pos = equals + 1
+      else:
+        separator = data.find(b"&", pos)
+        stop = end if separator < 0 else separator
+        value = data[pos:stop]
+        if separator < 0:
+          split = value.rfind(b"%", max(0, len(value) - 2))
+          if split >= 0:
+            self.__pending = value[split:]
+            value = value[:split]
+        else:
+          self.__state = _DONE
+        self.__payload += _unquote(value)
+        pos = stop + 1
+
+  def finish(self) -> bytes:
+    """
+    Get the payload once the whole body has been fed, raising a ``ValueError`` if there was none
+    """
+    if self.__state == _VALUE:
+      self.__payload += _unquote(self.__pending)
+      self.__pending = b""
+      self.__state = _DONE
+    if self.__state != _DONE:
+      raise ValueError("Form has no payload field")
+    return bytes(self.__payload)
+
+
+def form_payload(body: bytes) -> bytes:
+  """
+  Get the payload from a form encoded body that has already been read in full
+  """
+  decoder = FormPayloadDecoder()
+  for offset in range(0, len(body), CHUNK_SIZE):
+    decoder.feed(body[offset : offset + CHUNK_SIZE])
+    if decoder.done:
+      break
+  return decoder.finish()
@@ -3,10 +3,32 @@ GH event handlers
 """
 
 import logging
+from typing import Optional
+
+from msgspec import Raw
 
 from .conf import BoundEnv
-from .util import short_commit, truncate
-from .webhook import EmbedBody, Field, WebhookRouter
+from .models import (
+  CheckRun,
+  Comment,
+  Commit,
+  CommitComment,
+  Deployment,
+  DeploymentStatus,
+  Discussion,
+  Hook,
+  Issue,
+  Organization,
+  Package,
+  Page,
+  PullRequest,
+  Release,
+  Repository,
+  Review,
+  User,
+)
+from .util import first_line, short_commit, truncate, utf16_len
+from .webhook import DESCRIPTION_LENGTH, EmbedBody, Field, WebhookRouter, decode_each
 
 __slots__ = ["router"]
 
@@ -15,36 +37,51 @@ router = WebhookRouter()
 
 
 @router.handler("ping")
-def ping(zen, hook, repository, sender, organization=None) -> EmbedBody:
-  is_org = hook["type"] == "Organization"
-  name = organization["login"] if is_org else repository["full_name"]
+def ping(
+  zen: str,
+  hook: Hook,
+  sender: User,
+  repository: Optional[Repository] = None,
+  organization: Optional[Organization] = None,
+) -> EmbedBody:
+  is_org = hook.type == "Organization"
+  name = organization.login if is_org else repository.full_name
 
-  return EmbedBody(f"[{name}] {hook['type']} hook ping received", None, sender, 0xB8E98C, zen)
+  return EmbedBody(f"[{name}] {hook.type} hook ping received", None, sender, 0xB8E98C, zen)
 
 
 check_run_action = router.by_action("check_run")
 
 
+def check_target(check_run: CheckRun, repository: Repository) -> Optional[str]:
+  """
+  What a check ran against, either the pull request it's for or its branch
+  """
+  check_suite = check_run.check_suite
+  if len(check_suite.pull_requests):
+    pull = check_suite.pull_requests[0]
+    if pull.url.startswith(f"https://api.github.com/repos/{repository.full_name}"):
+      return f"PR #{pull.number}"
+  return check_suite.head_branch
+
+
 @check_run_action("completed")
 # @router.filter(test = BoundEnv.ignored_branch, path = ['check_run', 'check_suite', 'head_branch']) # would this ever be nicer? than injecting the env as a parameter
-def check_completed(env: BoundEnv, check_run, repository, sender) -> EmbedBody:
-  conclusion = check_run["conclusion"]
-  output = check_run["output"]
-  html_url = check_run["html_url"]
-  check_suite = check_run["check_suite"]
+def check_completed(env: BoundEnv, check_run: CheckRun, repository: Repository, sender: User) -> EmbedBody:
+  conclusion = check_run.conclusion
+  output = check_run.output
+  html_url = check_run.html_url
+  check_suite = check_run.check_suite
 
-  if not repository or not (target := check_suite["head_branch"]):
+  if not repository or not (target := check_suite.head_branch):
     logger.debug("No repo or no target (%s) for check run", target)
     return None
 
-  if env.ignored_branch(target):
+  if env.ignored_branch(target, repository.full_name):
     logger.debug("ignoring branch %s", target)
     return None
 
-  if len(check_suite["pull_requests"]):
-    pull = check_suite["pull_requests"][0]
-    if pull.url.startsWith(f"https://api.github.com/repos/{repository['full_name']}"):
-      target = f"PR #{pull.number}"
+  target = check_target(check_run, repository)
 
   color = 0xAAAAAA
   status = "failed"
@@ -69,16 +106,16 @@ def check_completed(env: BoundEnv, check_run, repository, sender) -> EmbedBody:
     case "skipped":
       status = "was skipped"
 
-  fields = [Field(name="Action Name", value=check_run["name"])]
+  fields = [Field(name="Action Name", value=check_run.name)]
 
-  if output.get("title"):
-    fields.append(Field(name="Output Title", value=output["title"]))
+  if output.title:
+    fields.append(Field(name="Output Title", value=output.title))
 
-  if output.get("summary"):
-    fields.append(Field(name="Output Summary", value=output["summary"]))
+  if output.summary:
+    fields.append(Field(name="Output Summary", value=output.summary))
 
   return EmbedBody(
-    f"[{repository['full_name']}] Actions check {status} on {target}",
+    f"[{repository.full_name}] Actions check {status} on {target}",
     html_url,
     sender,
     color,
@@ -90,53 +127,53 @@ commit_comment = router.by_action("commit_comment")
 
 
 @commit_comment("created")
-def commit_comment_created(env: BoundEnv, sender, comment, repository):
-  if env.ignored_user(sender["login"]):
+def commit_comment_created(env: BoundEnv, sender: User, comment: CommitComment, repository: Repository):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
   return EmbedBody(
-    f"[{repository['full_name']}] New comment on commit `{short_commit(comment['commit_id'])}`",
-    comment["html_url"],
+    f"[{repository.full_name}] New comment on commit `{short_commit(comment.commit_id)}`",
+    comment.html_url,
     sender,
     0x000001,
-    comment["body"],
+    comment.body,
   )
 
 
 @router.handler("create")
-def create_branch(env: BoundEnv, ref, ref_type, repository, sender):
-  if env.ignored_user(sender["login"]):
+def create_branch(env: BoundEnv, ref: str, ref_type: str, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
-  if ref_type == "branch" and env.ignored_branch(ref):
+  if ref_type == "branch" and env.ignored_branch(ref, repository.full_name):
     return None
 
-  return EmbedBody(f"[{repository['full_name']}] New {ref_type} created: {ref}", None, sender, 0x000001)
+  return EmbedBody(f"[{repository.full_name}] New {ref_type} created: {ref}", None, sender, 0x000001)
 
 
 @router.handler("delete")
-def delete_branch(env: BoundEnv, ref, ref_type, repository, sender):
-  if ref_type == "branch" and env.ignored_branch(ref):
+def delete_branch(env: BoundEnv, ref: str, ref_type: str, repository: Repository, sender: User):
+  if ref_type == "branch" and env.ignored_branch(ref, repository.full_name):
     return None
 
-  return EmbedBody(f"[{repository['full_name']}] {ref_type} deleted: {ref}", None, sender, 0x000001)
+  return EmbedBody(f"[{repository.full_name}] {ref_type} deleted: {ref}", None, sender, 0x000001)
 
 
 discussion_action = router.by_action("discussion")
 
 
 @discussion_action("created")
-def discussion_created(env: BoundEnv, discussion, repository, sender):
-  if env.ignored_user(sender.login):
+def discussion_created(env: BoundEnv, discussion: Discussion, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
   return EmbedBody(
-    f"[{repository['full_name']}] New discussion: #{discussion['number']} {discussion['title']}",
-    discussion["html_url"],
+    f"[{repository.full_name}] New discussion: #{discussion.number} {discussion.title}",
+    discussion.html_url,
     sender,
     0x9494FF,
-    discussion["body"],
-    f"Discussion Category: {discussion['category']['name']}",
+    discussion.body,
+    f"Discussion Category: {discussion.category.name}",
   )
 
 
@@ -144,25 +181,27 @@ discussion_comment_action = router.by_action("discussion_comment")
 
 
 @discussion_comment_action("created")
-def discussion_comment_created(env: BoundEnv, discussion, comment, repository, sender):
-  if env.ignored_user(sender["login"]):
+def discussion_comment_created(
+  env: BoundEnv, discussion: Discussion, comment: Comment, repository: Repository, sender: User
+):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
   return EmbedBody(
-    f"[{repository['full_name']}] New comment on discussion: #{discussion['number']} {discussion['title']}",
-    comment["html_url"],
+    f"[{repository.full_name}] New comment on discussion: #{discussion.number} {discussion.title}",
+    comment.html_url,
     sender,
     0x008A76,
     comment.body,
-    f"Discussion Category: {discussion['category']['name']}",
+    f"Discussion Category: {discussion.category.name}",
   )
 
 
 @router.handler("fork")
-def fork(sender, repository, forkee):
+def fork(sender: User, repository: Repository, forkee: Repository):
   return EmbedBody(
-    f"[{repository['full_name']}] Fork Created: {forkee['full_name']}",
-    forkee["html_url"],
+    f"[{repository.full_name}] Fork Created: {forkee.full_name}",
+    forkee.html_url,
     sender,
     0xFCB900,
   )
@@ -172,17 +211,17 @@ issue_comment_action = router.by_action("issue_comment")
 
 
 @issue_comment_action("created")
-def issue_comment_created(env: BoundEnv, issue, comment, repository, sender):
-  if env.ignored_user(sender["login"]):
+def issue_comment_created(env: BoundEnv, issue: Issue, comment: Comment, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
-  entity = "pull request" if "pull_request" in issue else "issue"
+  entity = "pull request" if issue.pull_request is not None else "issue"
   return EmbedBody(
-    f"[{repository['full_name']}] New comment on {entity}: #{issue['number']} {issue['title']}",
-    comment["html_url"],
+    f"[{repository.full_name}] New comment on {entity}: #{issue.number} {issue.title}",
+    comment.html_url,
     sender,
     0xAD8B00,
-    comment["body"],
+    comment.body,
   )
 
 
@@ -190,34 +229,34 @@ issues_action = router.by_action("issues")
 
 
 @issues_action("opened")
-def issues_opened(env: BoundEnv, issue, repository, sender):
-  if env.ignored_user(sender["login"]):
+def issues_opened(env: BoundEnv, issue: Issue, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
   return EmbedBody(
-    f"[{repository['full_name']}] Issue opened: #{issue['number']} {issue['title']}",
-    issue["html_url"],
+    f"[{repository.full_name}] Issue opened: #{issue.number} {issue.title}",
+    issue.html_url,
     sender,
     0xFF7D00,
-    issue["body"],
+    issue.body,
   )
 
 
 @issues_action("reopened")
-def issues_reopened(issue, repository, sender):
+def issues_reopened(issue: Issue, repository: Repository, sender: User):
   return EmbedBody(
-    f"[{repository['full_name']}] Issue reopened: #{issue['number']} {issue['title']}",
-    issue["html_url"],
+    f"[{repository.full_name}] Issue reopened: #{issue.number} {issue.title}",
+    issue.html_url,
     sender,
     0xFF7D00,
   )
 
 
 @issues_action("closed")
-def issues_closed(issue, repository, sender):
+def issues_closed(issue: Issue, repository: Repository, sender: User):
   return EmbedBody(
-    f"[{repository['full_name']}] Issue closed: #{issue['number']} {issue['title']}",
-    issue["html_url"],
+    f"[{repository.full_name}] Issue closed: #{issue.number} {issue.title}",
+    issue.html_url,
     sender,
     0xFF482F,
   )
@@ -227,24 +266,34 @@ package_action = router.by_action("package")
 
 
 @package_action("published")
-def package_published(sender, repository, package=None, registry_package=None):
+def package_published(
+  sender: User,
+  repository: Repository,
+  package: Optional[Package] = None,
+  registry_package: Optional[Package] = None,
+):
   pkg = package if package else registry_package
 
   return EmbedBody(
-    f"[{repository['full_name']}] Package Published: {pkg['namespace']}/{pkg['name']}",
-    pkg["package_version"]["html_url"],
+    f"[{repository.full_name}] Package Published: {pkg.namespace}/{pkg.name}",
+    pkg.package_version.html_url,
     sender,
     0x009202,
   )
 
 
 @package_action("updated")
-def package_updated(sender, repository, package=None, registry_package=None):
+def package_updated(
+  sender: User,
+  repository: Repository,
+  package: Optional[Package] = None,
+  registry_package: Optional[Package] = None,
+):
   pkg = package if package else registry_package
 
   return EmbedBody(
-    f"[{repository['full_name']}] Package Updated: {pkg['namespace']}/{pkg['name']}",
-    pkg["package_version"]["html_url"],
+    f"[{repository.full_name}] Package Updated: {pkg.namespace}/{pkg.name}",
+    pkg.package_version.html_url,
     sender,
     0x9202,
   )
@@ -254,68 +303,68 @@ pull_request_action = router.by_action("pull_request")
 
 
 @pull_request_action("opened")
-def pull_request_opened(env: BoundEnv, pull_request, repository, sender):
-  if env.ignored_user(sender["login"]):
+def pull_request_opened(env: BoundEnv, pull_request: PullRequest, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
-  draft = pull_request["draft"]
+  draft = pull_request.draft
   color = 0xA7A7A7 if draft else 0x009202
   pr_type = "Draft pull request" if draft else "Pull request"
 
   return EmbedBody(
-    f"[{repository['full_name']}] {pr_type} opened: #{pull_request['number']} {pull_request['title']}",
-    pull_request["html_url"],
+    f"[{repository.full_name}] {pr_type} opened: #{pull_request.number} {pull_request.title}",
+    pull_request.html_url,
     sender,
     color,
   )
 
 
 @pull_request_action("closed")
-def pull_request_closed(pull_request, repository, sender):
-  merged = pull_request["merged"]
+def pull_request_closed(pull_request: PullRequest, repository: Repository, sender: User):
+  merged = pull_request.merged
   color = 0x8748FF if merged else 0xFF293A
   status = "merged" if merged else "closed"
 
   return EmbedBody(
-    f"[{repository['full_name']}] Pull request {status}: #{pull_request['number']} {pull_request['title']}",
-    pull_request["html_url"],
+    f"[{repository.full_name}] Pull request {status}: #{pull_request.number} {pull_request.title}",
+    pull_request.html_url,
     sender,
     color,
   )
 
 
 @pull_request_action("reopened")
-def pull_request_reopened(env: BoundEnv, pull_request, repository, sender):
-  if env.ignored_user(sender["login"]):
+def pull_request_reopened(env: BoundEnv, pull_request: PullRequest, repository: Repository, sender: User):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
-  draft = pull_request["draft"]
+  draft = pull_request.draft
   color = 0xA7A7A7 if draft else 0x009202
   pr_type = "Draft pull request" if draft else "Pull request"
 
   return EmbedBody(
-    f"[{repository['full_name']}] {pr_type} reopened: #{pull_request['number']} {pull_request['title']}",
-    pull_request["html_url"],
+    f"[{repository.full_name}] {pr_type} reopened: #{pull_request.number} {pull_request.title}",
+    pull_request.html_url,
     sender,
     color,
   )
 
 
 @pull_request_action("converted_to_draft")
-def pull_request_converted_to_draft(pull_request, repository, sender):
+def pull_request_converted_to_draft(pull_request: PullRequest, repository: Repository, sender: User):
   return EmbedBody(
-    f"[{repository['full_name']}] Pull request marked as draft: #{pull_request['number']} {pull_request['title']}",
-    pull_request["html_url"],
+    f"[{repository.full_name}] Pull request marked as draft: #{pull_request.number} {pull_request.title}",
+    pull_request.html_url,
     sender,
     0xA7A7A7,
   )
 
 
 @pull_request_action("ready_for_review")
-def pull_request_ready_for_review(pull_request, repository, sender):
+def pull_request_ready_for_review(pull_request: PullRequest, repository: Repository, sender: User):
   return EmbedBody(
-    f"[{repository['full_name']}] Pull request marked for review: #{pull_request['number']} {pull_request['title']}",
-    pull_request["html_url"],
+    f"[{repository.full_name}] Pull request marked for review: #{pull_request.number} {pull_request.title}",
+    pull_request.html_url,
     sender,
     0x009202,
   )
@@ -326,11 +375,11 @@ pull_request_review_action = router.by_action("pull_request_review")
 
 @pull_request_review_action("submitted")
 @pull_request_review_action("dismissed")
-def pull_request_review(pull_request, review, repository, action, sender):
+def pull_request_review(pull_request: PullRequest, review: Review, repository: Repository, action: str, sender: User):
   state = "reviewed"
   color = 7829367
 
-  match review["state"]:
+  match review.state:
     case "approved":
       state = "approved"
       color = 37378
@@ -342,11 +391,11 @@ def pull_request_review(pull_request, review, repository, action, sender):
         state = "review dismissed"
 
   return EmbedBody(
-    f"[{repository['full_name']}] Pull request {state}: #{pull_request['number']} {pull_request['title']}",
-    review["html_url"],
+    f"[{repository.full_name}] Pull request {state}: #{pull_request.number} {pull_request.title}",
+    review.html_url,
     sender,
     color,
-    review["body"],
+    review.body,
   )
 
 
@@ -354,28 +403,40 @@ pull_request_review_comment_action = router.by_action("pull_request_review_comme
 
 
 @pull_request_review_comment_action("created")
-def pull_request_review_comment_created(pull_request, comment, repository, sender):
+def pull_request_review_comment_created(
+  pull_request: PullRequest, comment: Comment, repository: Repository, sender: User
+):
   return EmbedBody(
-    f"[{repository['full_name']}] Pull request review comment: #{pull_request['number']} {pull_request['title']}",
-    comment["html_url"],
+    f"[{repository.full_name}] Pull request review comment: #{pull_request.number} {pull_request.title}",
+    comment.html_url,
     sender,
     0x777777,
-    comment["body"],
+    comment.body,
   )
 
 
 @router.handler("push")
-def push(env: BoundEnv, commits, forced, after, repository, ref, compare, sender):
+def push(
+  env: BoundEnv,
+  # only the commits that fit in the description are decoded
+  commits: list[Raw],
+  forced: bool,
+  after: str,
+  repository: Repository,
+  ref: str,
+  compare: str,
+  sender: User,
+):
   branch = ref[11:]
 
-  if env.ignored_branch(branch):
+  if env.ignored_branch(branch, repository.full_name):
     return None
-  if env.ignored_user(sender["login"]):
+  if env.ignored_user(sender.login, repository.full_name):
     return None
 
   if forced:
     return EmbedBody(
-      f"[{repository['full_name']}] Branch {branch} was force-pushed to `{short_commit(after)}`",
+      f"[{repository.full_name}] Branch {branch} was force-pushed to `{short_commit(after)}`",
       compare.replace("...", ".."),
       sender,
       0xFF293A,
@@ -385,25 +446,33 @@ def push(env: BoundEnv, commits, forced, after, repository, ref, compare, sender
   if amount == 0:
     return None
 
-  description = ""
+  # stop as soon as the description is full, leaving room to say how many commits didn't fit
+  reserve = utf16_len(f"and {amount} more commits")
+  lines = []
+  length = 0
   last_commit_url = ""
-  for commit in commits:
-    commit_url = commit["url"]
-    line = f"[`{short_commit(commit['id'])}`]({commit_url}) {truncate(commit['message'].split('\n')[0], 50)} - {commit['author']['username']}\n"
-    if (len(description) + len(line)) >= 1500:
+  for i, commit in enumerate(decode_each(commits, Commit)):
+    line = f"[`{short_commit(commit.id)}`]({commit.url}) {truncate(first_line(commit.message), 50) or ''} - {commit.author.username}"
+    room = DESCRIPTION_LENGTH if i == amount - 1 else DESCRIPTION_LENGTH - reserve
+    line_length = utf16_len(line)
+    if length + line_length + 1 > room:
       break
 
-    last_commit_url = commit_url
-    description += line
+    last_commit_url = commit.url
+    lines.append(line)
+    length += line_length + 1
+
+  if (remaining := amount - len(lines)) > 0:
+    lines.append(f"and {remaining} more {'commit' if remaining == 1 else 'commits'}")
 
   commit_word = "commit" if amount == 1 else "commits"
 
   return EmbedBody(
-    f"[{repository['name']}:{branch}] {amount} new {commit_word}",
+    f"[{repository.name}:{branch}] {amount} new {commit_word}",
     last_commit_url if amount == 1 else compare,
     sender,
     0x5D62E4,
-    description,
+    "\n".join(lines),
   )
 
 
@@ -412,20 +481,20 @@ release_action = router.by_action("release")
 
 @release_action("released")
 @release_action("prereleased")
-def release_released(release, repository, sender):
-  if release["draft"]:
+def release_released(release: Release, repository: Repository, sender: User):
+  if release.draft:
     return None
 
-  effective_name = release.get("name", None)
+  effective_name = release.name
   if not effective_name:
-    effective_name = release["tag_name"]
+    effective_name = release.tag_name
 
   return EmbedBody(
-    f"[{repository['full_name']}] New {'pre' if release['prerelease'] else ''}release published: {effective_name}",
-    release["html_url"],
+    f"[{repository.full_name}] New {'pre' if release.prerelease else ''}release published: {effective_name}",
+    release.html_url,
     sender,
     0xDE5DE4,
-    release["body"],
+    release.body,
   )
 
 
@@ -433,10 +502,10 @@ star_action = router.by_action("star")
 
 
 @star_action("created")
-def star_created(sender, repository):
+def star_created(sender: User, repository: Repository):
   return EmbedBody(
-    f"[{repository['full_name']}] New star added",
-    repository["html_url"],
+    f"[{repository.full_name}] New star added",
+    repository.html_url,
     sender,
     0xFCB900,
   )
@@ -446,28 +515,22 @@ deployment_action = router.by_action("deployment")
 
 
 @deployment_action("created")
-def deployment_created(deployment, repository, sender):
-  web_url = deployment["payload"].get("web_url")
-  if not web_url:
-    web_url = ""
-
+def deployment_created(deployment: Deployment, repository: Repository, sender: User):
   return EmbedBody(
-    f"[{repository['full_name']}] Deployment started for {deployment['description']}",
-    web_url,
+    f"[{repository.full_name}] Deployment started for {deployment.description}",
+    deployment.web_url,
     sender,
     0xAA44B9,
   )
 
 
 @router.handler("deployment_status")
-def deployment_status(deployment, deployment_status, repository, sender):
-  web_url = deployment["payload"].get("web_url")
-  if not web_url:
-    web_url = ""
-
+def deployment_status(
+  deployment: Deployment, deployment_status: DeploymentStatus, repository: Repository, sender: User
+):
   color = 0xFF3B3B
   term = "succeeded"
-  match deployment_status["state"]:
+  match deployment_status.state:
     case "success":
       color = 0x00B32A
     case "failure":
@@ -478,15 +541,15 @@ def deployment_status(deployment, deployment_status, repository, sender):
       return None
 
   return EmbedBody(
-    f"[{repository['full_name']}] Deployment for {deployment['description']} {term}",
-    web_url,
+    f"[{repository.full_name}] Deployment for {deployment.description} {term}",
+    deployment.web_url,
     sender,
     color,
   )
 
 
 @router.handler("gollum")
-def gollum(pages, sender, repository):
+def gollum(pages: list[Page], sender: User, repository: Repository):
   # Pages is always an array with several "actions".
   # Count the amount of "created" and "edited" actions and store the amount in a variable.
   # Also store the titles of the pages in an array since we will need them later.
@@ -494,14 +557,14 @@ def gollum(pages, sender, repository):
   edited = 0
   titles: list[str] = []
   for page in pages:
-    action = page["action"]
+    action = page.action
     if action == "created":
       created += 1
     elif action == "edited":
       edited += 1
 
     # Wrap the title in a markdown with the link to the page.
-    title = f"[{page['title']}](${page['html_url']})"
+    title = f"[{page.title}]({page.html_url})"
 
     # Capitalize the first letter of the action, then prepend it to the title.
     titles.insert(0, f"{action[0].upper() + action[1:]}: {title}")
@@ -531,12 +594,12 @@ def gollum(pages, sender, repository):
       message = f"{max(created, edited)} pages were {'created' if created > 0 else 'edited'}"
 
   # Prepend the repository title to the message.
-  message = f"[{repository['full_name']}] {message}"
+  message = f"[{repository.full_name}] {message}"
 
   # Build the embed, with the sender as the author, the message as the title, and the edited pages as the description.
   return EmbedBody(
     message,
-    repository["html_url"],
+    repository.html_url,
     sender,
     color,
     "\n".join(titles),
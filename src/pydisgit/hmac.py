@@ -5,67 +5,144 @@ ASGI middleware to verify HMAC signatures from GH
 import hmac
 import logging
 from collections.abc import Callable
+from time import perf_counter
+from typing import Optional
 
 from hypercorn.typing import Scope
 
+from .metrics import REQUESTS, STAGE_SECONDS
+
 logger = logging.getLogger(__name__)
 
+# scope key holding a request body that has already been read and verified
+VERIFIED_BODY = "pydisgit.verified_body"
+
+_SIGNATURE_PREFIX = b"sha256="
+
+
+class _BodyTooLarge(Exception):
+  pass
+
+
+def verified_body(scope: Scope) -> Optional[bytes]:
+  """
+  Get the body verified by ``HmacVerifyMiddleware`` for a request, if any
+  """
+  return scope.get(VERIFIED_BODY)
+
 
 class HmacVerifyMiddleware:
   """
   Middleware to verify HMAC signatures inserted by GitHub.
+
+  The body is read once, up to ``max_body_size`` bytes, and checked before
+  the app sees any of the request. Verified bodies are handed on through
+  the scope under ``VERIFIED_BODY`` rather than being streamed to the app
+  again, so they are never copied into a second buffer.
   """
 
-  def __init__(self, app, hmac_secret) -> None:
+  def __init__(self, app, hmac_secret, max_body_size: int) -> None:
     self.app = app
     self.__hmac_secret = hmac_secret.encode() if hmac_secret else None
+    self.__max_body_size = max_body_size
 
   async def __call__(self, scope: Scope, receive: Callable, send: Callable) -> None:
-    if self.__hmac_secret is None or scope["type"] != "http" or len(scope["path"]) <= len("/health"):
+    # only webhook deliveries are signed, everything else is read-only
+    if self.__hmac_secret is None or scope["type"] != "http" or scope["method"] != "POST":
       await self.app(scope, receive, send)
       return
 
     # processing an http connection
     signature_header = None
+    content_length = None
+    event = b""
     for k, v in scope["headers"]:
-      if k.lower() == b"x-hub-signature-256":
+      k = k.lower()
+      if k == b"x-hub-signature-256":
         signature_header = v
-        break
+      elif k == b"content-length":
+        content_length = v
+      elif k == b"x-github-event":
+        event = v
 
-    if signature_header is None:
-      await self.__error_response__(receive, send, "No signature provided")
+    if signature_header is None or not signature_header.startswith(_SIGNATURE_PREFIX):
+      REQUESTS.inc(event.decode("latin-1"), "", "unauthorized")
+      await self.__error_response__(send, 403, "No signature provided")
       return
 
-    digest = hmac.new(key=self.__hmac_secret, digestmod="sha256")
-    await self.app(
-      scope,
-      self.recv_proxy(digest, signature_header[len("sha256=") :], receive, send),
-      send,
-    )
+    if content_length is not None and (not content_length.isdigit() or int(content_length) > self.__max_body_size):
+      REQUESTS.inc(event.decode("latin-1"), "", "too_large")
+      await self.__error_response__(send, 413, "Request body is too large")
+      return
+
+    try:
+      body = await self.__read_body(receive)
+    except _BodyTooLarge:
+      REQUESTS.inc(event.decode("latin-1"), "", "too_large")
+      await self.__error_response__(send, 413, "Request body is too large")
+      return
+
+    if body is None:
+      # client went away
+      return
+
+    start = perf_counter()
+    expected = signature_header[len(_SIGNATURE_PREFIX) :]
+    result = hmac.new(self.__hmac_secret, body, "sha256").hexdigest().encode()
+    matched = hmac.compare_digest(result, expected)
+    STAGE_SECONDS.since(start, "hmac")
+    if not matched:
+      REQUESTS.inc(event.decode("latin-1"), "", "unauthorized")
+      logger.debug("Hash mismatch on request, got %s but expected %s", result, expected)
+      await self.__error_response__(send, 403, "Hash digest did not match expected")
+      return
+
+    await self.app({**scope, VERIFIED_BODY: body}, self.recv_proxy(receive), send)
+
+  async def __read_body(self, recv: Callable) -> Optional[bytes]:
+    """
+    Read the whole request body, or ``None`` if the client disconnected first
+    """
+    chunks = []
+    size = 0
+    while True:
+      message = await recv()
+      if message["type"] == "http.disconnect":
+        return None
+
+      chunk = message.get("body", b"")
+      size += len(chunk)
+      if size > self.__max_body_size:
+        raise _BodyTooLarge
+      if chunk:
+        chunks.append(chunk)
+      if not message.get("more_body", False):
+        break
+
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+  def recv_proxy(self, recv: Callable) -> Callable:
+    """
+    Tell the app the body is complete, since it will read it from the scope
+    """
+    consumed = False
 
-  def recv_proxy(self, digest: hmac.HMAC, expected: bytes, recv: Callable, send: Callable) -> Callable:
     async def responder() -> dict:
-      response = await recv()
-      if response["type"] == "http.request":
-        digest.update(response["body"])
-        if not response["more_body"]:
-          result = digest.hexdigest().encode()
-          if result != expected:
-            # send error response
-            logger.debug("Hash mismatch on request, got %s but expected %s", result, expected)
-            await self.__error_response__(recv, send, "Hash digest did not match expected")
-            return {"type": "http.disconnect"}
-      return response
+      nonlocal consumed
+      if not consumed:
+        consumed = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+      return await recv()
 
     return responder
 
-  async def __error_response__(self, recv: Callable, send: Callable, message: str) -> None:
+  async def __error_response__(self, send: Callable, status: int, message: str) -> None:
     bstr = message.encode()
     await send(
       {
         "type": "http.response.start",
-        "status": 403,
-        "headers": [(b"content-length", str(len(bstr)).encode())],
+        "status": status,
+        "headers": [(b"content-length", str(len(bstr)).encode()), (b"content-type", b"text/plain; charset=utf-8")],
       }
     )
     await send(
@@ -0,0 +1,160 @@
+"""
+Tracking of the Discord message for each pull request and issue, so that
+later changes to it can edit that message rather than send another.
+"""
+
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+
+import msgspec
+
+from .webhook import PayloadError
+
+# actions that move a pull request or issue through its lifecycle, which edit its message
+LIFECYCLE_ACTIONS = frozenset({"opened", "reopened", "closed", "converted_to_draft", "ready_for_review"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+  key TEXT PRIMARY KEY,
+  message_id TEXT NOT NULL,
+  expires REAL NOT NULL
+)
+"""
+
+# how many writes between sweeps of expired entries from the database
+_PRUNE_INTERVAL = 256
+# locks kept for threads before idle ones are dropped
+_MAX_LOCKS = 1024
+
+
+class _Repository(msgspec.Struct, gc=False):
+  full_name: str
+
+
+class _Numbered(msgspec.Struct, gc=False):
+  number: int
+
+
+class _PullRequestEvent(msgspec.Struct, gc=False):
+  number: int
+  repository: _Repository
+
+
+class _IssuesEvent(msgspec.Struct, gc=False):
+  issue: _Numbered
+  repository: _Repository
+
+
+_pull_request_decoder = msgspec.json.Decoder(_PullRequestEvent)
+_issues_decoder = msgspec.json.Decoder(_IssuesEvent)
+
+
+def thread_key(event: str, data: bytes) -> Optional[str]:
+  """
+  Identify the pull request or issue a payload is for, if it's a lifecycle event for one
+  """
+  try:
+    if event == "pull_request":
+      pull = _pull_request_decoder.decode(data)
+      return f"{pull.repository.full_name}#{pull.number}"
+    if event == "issues":
+      issue = _issues_decoder.decode(data)
+      return f"{issue.repository.full_name}#{issue.issue.number}"
+  except msgspec.ValidationError as e:
+    raise PayloadError(f"Payload has an invalid {event} number: {e}") from e
+  except msgspec.DecodeError as e:
+    raise PayloadError(f"Payload is not valid JSON: {e}") from e
+  return None
+
+
+class MessageStore:
+  """
+  Discord message ids by webhook and thread in a SQLite database, forgotten after ``ttl`` seconds.
+
+  Entries are dropped in order of expiry once there are more than ``max_entries``.
+  All database access happens on a single dedicated thread.
+  """
+
+  def __init__(self, path: str | Path, logger: Logger, max_entries: int, ttl: float):
+    self.__path = path
+    self.__logger = logger
+    self.__max_entries = max_entries
+    self.__ttl = ttl
+    self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pydisgit-messages")
+    self.__db: Optional[sqlite3.Connection] = None
+    self.__writes = 0
+    self.__locks: dict[str, asyncio.Lock] = {}
+
+  def lock(self, key: str) -> asyncio.Lock:
+    """
+    The lock to hold from looking up the message for ``key`` until it's recorded, so that events arriving
+    together for the same thread don't each send a new message
+    """
+    lock = self.__locks.get(key)
+    if lock is None:
+      if len(self.__locks) >= _MAX_LOCKS:
+        self.__locks = {k: v for k, v in self.__locks.items() if v.locked()}
+      lock = self.__locks[key] = asyncio.Lock()
+    return lock
+
+  async def open(self) -> None:
+    await self.__run(self.__open)
+
+  async def close(self) -> None:
+    await self.__run(self.__db.close)
+    self.__executor.shutdown()
+
+  async def get(self, key: str) -> Optional[str]:
+    try:
+      return await self.__run(self.__get, key)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to read message for %s", key)
+      return None
+
+  async def put(self, key: str, message_id: str) -> None:
+    self.__writes += 1
+    prune = self.__writes % _PRUNE_INTERVAL == 0
+    try:
+      await self.__run(self.__put, key, message_id, prune)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to record message for %s", key)
+
+  async def __run(self, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+  # executor thread
+
+  def __open(self) -> None:
+    if str(self.__path) != ":memory:":
+      Path(self.__path).parent.mkdir(parents=True, exist_ok=True)
+    self.__db = sqlite3.connect(self.__path, isolation_level=None, check_same_thread=False, timeout=5)
+    self.__db.execute("PRAGMA journal_mode=WAL")
+    # losing the last few entries in a crash only means a new message rather than an edit
+    self.__db.execute("PRAGMA synchronous=NORMAL")
+    self.__db.execute(_SCHEMA)
+
+  def __get(self, key: str) -> Optional[str]:
+    row = self.__db.execute(
+      "SELECT message_id FROM messages WHERE key = ? AND expires > ?", (key, time.time())
+    ).fetchone()
+    return row[0] if row is not None else None
+
+  def __put(self, key: str, message_id: str, prune: bool) -> None:
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN")
+      self.__db.execute(
+        "INSERT OR REPLACE INTO messages (key, message_id, expires) VALUES (?, ?, ?)",
+        (key, message_id, now + self.__ttl),
+      )
+      if prune:
+        self.__db.execute("DELETE FROM messages WHERE expires <= ?", (now,))
+        self.__db.execute(
+          "DELETE FROM messages WHERE key IN (SELECT key FROM messages ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+          (self.__max_entries,),
+        )
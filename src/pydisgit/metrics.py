@@ -0,0 +1,252 @@
+"""
+Prometheus metrics, rendered in the text exposition format.
+
+Values are recorded from the event loop thread, and from render threads when
+rendering is offloaded to a thread pool. Recording a value is a plain dict
+update with no locking, so a rare update racing another may be lost, and
+series are copied before they are rendered. Label values that come from
+requests are capped per metric so that a misbehaving sender can't grow them
+without bound.
+"""
+
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from time import perf_counter
+
+# label values recorded once a metric has ``max_series`` series already
+OVERFLOW = "other"
+
+# latency buckets, in seconds, from 50µs up to Discord taking its time
+DEFAULT_BUCKETS = (
+  0.00005,
+  0.0001,
+  0.00025,
+  0.0005,
+  0.001,
+  0.0025,
+  0.005,
+  0.01,
+  0.025,
+  0.05,
+  0.1,
+  0.25,
+  0.5,
+  1.0,
+  2.5,
+  5.0,
+  10.0,
+  30.0,
+)
+
+type Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+  return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+  pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value))
+
+
+class _Metric:
+  type_name = ""
+
+  def __init__(self, name: str, documentation: str, label_names: Labels = (), max_series: int = 256):
+    self.name = name
+    self.documentation = documentation
+    self.label_names = label_names
+    self._max_series = max_series
+
+  def _key(self, series: dict, labels: Labels) -> Labels:
+    if labels in series or len(series) < self._max_series:
+      return labels
+    return (OVERFLOW,) * len(self.label_names)
+
+  def _samples(self) -> Iterable[str]:
+    raise NotImplementedError
+
+  def render(self) -> Iterable[str]:
+    yield f"# HELP {self.name} {self.documentation}"
+    yield f"# TYPE {self.name} {self.type_name}"
+    yield from self._samples()
+
+
+class Counter(_Metric):
+  """
+  A value that only goes up, per set of labels
+  """
+
+  type_name = "counter"
+
+  def __init__(self, name: str, documentation: str, label_names: Labels = (), max_series: int = 256):
+    super().__init__(name, documentation, label_names, max_series)
+    self.__values: dict[Labels, float] = {}
+
+  def inc(self, *labels: str, amount: float = 1) -> None:
+    values = self.__values
+    key = self._key(values, labels)
+    values[key] = values.get(key, 0) + amount
+
+  def value(self, *labels: str) -> float:
+    return self.__values.get(labels, 0)
+
+  def _samples(self) -> Iterable[str]:
+    for labels, value in list(self.__values.items()):
+      yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+  """
+  A value read from a callback whenever metrics are collected
+  """
+
+  type_name = "gauge"
+
+  def __init__(self, name: str, documentation: str):
+    super().__init__(name, documentation)
+    self.__function: Callable[[], float] | None = None
+
+  def set_function(self, function: Callable[[], float] | None) -> None:
+    self.__function = function
+
+  def _samples(self) -> Iterable[str]:
+    if self.__function is not None:
+      yield f"{self.name} {_format_value(self.__function())}"
+
+
+class _Series:
+  __slots__ = ("counts", "sum")
+
+  def __init__(self, buckets: int):
+    # one more than the bounds, for +Inf
+    self.counts = [0] * (buckets + 1)
+    self.sum = 0.0
+
+
+class Histogram(_Metric):
+  """
+  Counts of observations falling into fixed buckets, per set of labels
+  """
+
+  type_name = "histogram"
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    label_names: Labels = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    max_series: int = 256,
+  ):
+    super().__init__(name, documentation, label_names, max_series)
+    self.__bounds = buckets
+    self.__series: dict[Labels, _Series] = {}
+
+  def observe(self, value: float, *labels: str) -> None:
+    series = self.__series.get(labels)
+    if series is None:
+      key = self._key(self.__series, labels)
+      series = self.__series.get(key)
+      if series is None:
+        series = self.__series[key] = _Series(len(self.__bounds))
+
+    series.counts[bisect_left(self.__bounds, value)] += 1
+    series.sum += value
+
+  def since(self, start: float, *labels: str) -> None:
+    """
+    Observe the time elapsed since ``start``, a value from ``time.perf_counter``
+    """
+    self.observe(perf_counter() - start, *labels)
+
+  def count(self, *labels: str) -> int:
+    series = self.__series.get(labels)
+    return sum(series.counts) if series is not None else 0
+
+  def _samples(self) -> Iterable[str]:
+    for labels, series in list(self.__series.items()):
+      cumulative = 0
+      for bound, count in zip((*self.__bounds, float("inf")), series.counts):
+        cumulative += count
+        le = f'le="{_format_value(bound)}"'
+        yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+      yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series.sum)}"
+      yield f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}"
+
+
+REQUESTS = Counter(
+  "pydisgit_webhook_requests_total",
+  "Webhook requests received, by event, action and outcome",
+  ("event", "action", "outcome"),
+)
+STAGE_SECONDS = Histogram(
+  "pydisgit_stage_duration_seconds",
+  "Time spent in each stage of handling a webhook",
+  ("stage",),
+)
+HANDLER_SECONDS = Histogram(
+  "pydisgit_handler_duration_seconds",
+  "Time spent decoding a payload and running its handler, by handler",
+  ("handler",),
+)
+DISCORD_RESPONSES = Counter(
+  "pydisgit_discord_responses_total",
+  "Responses from Discord to webhook executions, by status code",
+  ("status",),
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+  "pydisgit_discord_rate_limit_wait_seconds",
+  "Time requests to Discord were held back by rate limits or retry backoff, by reason",
+  ("reason",),
+)
+HTTP_IN_FLIGHT = Gauge(
+  "pydisgit_http_requests_in_flight",
+  "Requests to Discord waiting for or holding a pooled connection",
+)
+HTTP_POOL_WAIT_SECONDS = Histogram(
+  "pydisgit_http_pool_wait_seconds",
+  "Time requests to Discord waited for a connection from the pool",
+)
+HTTP_CONNECTIONS_OPENED = Counter(
+  "pydisgit_http_connections_opened_total",
+  "Connections opened to Discord",
+)
+QUEUE_DEPTH = Gauge(
+  "pydisgit_delivery_queue_depth",
+  "Messages waiting in the delivery queue",
+)
+
+METRICS: list[_Metric] = [
+  REQUESTS,
+  STAGE_SECONDS,
+  HANDLER_SECONDS,
+  DISCORD_RESPONSES,
+  RATE_LIMIT_WAIT_SECONDS,
+  HTTP_IN_FLIGHT,
+  HTTP_POOL_WAIT_SECONDS,
+  HTTP_CONNECTIONS_OPENED,
+  QUEUE_DEPTH,
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+  """
+  Render every metric in the Prometheus text format
+  """
+  lines = []
+  for metric in METRICS:
+    lines.extend(metric.render())
+  lines.append("")
+  return "\n".join(lines)
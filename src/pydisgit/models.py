@@ -0,0 +1,170 @@
+"""
+Typed views of GitHub webhook payloads.
+
+Each model only declares the fields handlers actually read, so decoding a
+payload into them skips over everything else without materialising it.
+"""
+
+from typing import Any, Optional
+
+from msgspec import Struct
+
+
+class User(Struct, gc=False):
+  """
+  A GitHub user or organization, such as the sender of an event
+  """
+
+  login: str
+  html_url: str
+  avatar_url: str
+
+
+class Organization(Struct, gc=False):
+  login: str
+
+
+class Repository(Struct, gc=False):
+  name: str
+  full_name: str
+  html_url: str
+
+
+class Hook(Struct, gc=False):
+  type: str
+
+
+class PullRequestRef(Struct, gc=False):
+  """
+  A pull request as referenced from a check suite
+  """
+
+  url: str
+  number: int
+
+
+class CheckSuite(Struct, gc=False):
+  head_sha: str
+  head_branch: Optional[str] = None
+  pull_requests: list[PullRequestRef] = []
+
+
+class CheckRunOutput(Struct, gc=False):
+  title: Optional[str] = None
+  summary: Optional[str] = None
+
+
+class CheckRun(Struct, gc=False):
+  name: str
+  html_url: str
+  check_suite: CheckSuite
+  output: CheckRunOutput
+  conclusion: Optional[str] = None
+
+
+class Comment(Struct, gc=False):
+  html_url: str
+  body: Optional[str] = None
+
+
+class CommitComment(Comment, gc=False):
+  commit_id: str = ""
+
+
+class DiscussionCategory(Struct, gc=False):
+  name: str
+
+
+class Discussion(Struct, gc=False):
+  number: int
+  title: str
+  html_url: str
+  category: DiscussionCategory
+  body: Optional[str] = None
+
+
+class IssuePullRequest(Struct, gc=False):
+  """
+  Present on issues that are actually pull requests
+  """
+
+  html_url: Optional[str] = None
+
+
+class Issue(Struct, gc=False):
+  number: int
+  title: str
+  html_url: str
+  body: Optional[str] = None
+  pull_request: Optional[IssuePullRequest] = None
+
+
+class PackageVersion(Struct, gc=False):
+  html_url: str
+
+
+class Package(Struct, gc=False):
+  namespace: str
+  name: str
+  package_version: PackageVersion
+
+
+class PullRequest(Struct, gc=False):
+  number: int
+  title: str
+  html_url: str
+  draft: bool = False
+  merged: bool = False
+
+
+class Review(Struct, gc=False):
+  state: str
+  html_url: str
+  body: Optional[str] = None
+
+
+class CommitAuthor(Struct, gc=False):
+  name: str
+  username: Optional[str] = None
+
+
+class Commit(Struct, gc=False):
+  id: str
+  url: str
+  message: str
+  author: CommitAuthor
+
+
+class Release(Struct, gc=False):
+  tag_name: str
+  html_url: str
+  draft: bool = False
+  prerelease: bool = False
+  name: Optional[str] = None
+  body: Optional[str] = None
+
+
+class Deployment(Struct, gc=False):
+  description: Optional[str] = None
+  # free-form, and either an object or a string
+  payload: Any = None
+
+  @property
+  def web_url(self) -> str:
+    if isinstance(self.payload, dict):
+      return self.payload.get("web_url") or ""
+    return ""
+
+
+class DeploymentStatus(Struct, gc=False):
+  state: str
+
+
+class Page(Struct, gc=False):
+  """
+  A wiki page touched by a gollum event
+  """
+
+  title: str
+  html_url: str
+  action: str
@@ -0,0 +1,340 @@
+"""
+Scheduling of Discord requests around its rate limits
+"""
+
+import asyncio
+import random
+import sqlite3
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+
+from httpx import ConnectError, ConnectTimeout, PoolTimeout, Response, TransportError
+
+from .metrics import RATE_LIMIT_WAIT_SECONDS
+
+
+class _Bucket:
+  """
+  Rate limit state for a single webhook
+  """
+
+  __slots__ = ("lock", "remaining", "reset_at")
+
+  def __init__(self):
+    self.lock = asyncio.Lock()
+    self.remaining: Optional[int] = None
+    self.reset_at = 0.0
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+  key TEXT PRIMARY KEY,
+  remaining INTEGER NOT NULL,
+  reset_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS global (
+  id INTEGER PRIMARY KEY CHECK (id = 0),
+  reset_at REAL NOT NULL
+);
+"""
+
+# buckets whose window ended this long ago are forgotten
+_STALE_BUCKET_AGE = 60.0
+# how long other workers hold off while one request finds out the state of a bucket
+_PROBE_TIMEOUT = 5.0
+# the longest to sleep before checking the shared state again
+_POLL_INTERVAL = 0.1
+# errors that mean a request never reached Discord, so that sending it again can't post a message twice
+_UNSENT_ERRORS = (ConnectError, ConnectTimeout, PoolTimeout)
+
+
+class SharedRateLimits:
+  """
+  Rate limit state in a SQLite database, shared by every worker process.
+
+  Each request reserves a slot in its bucket before it is sent, so that workers
+  don't each spend the whole bucket. When the state of a bucket isn't known,
+  one request goes ahead to find out while the others wait for its response,
+  the same as the per-bucket lock within a worker. Times are stored as wall-clock time, since
+  monotonic clocks aren't comparable between processes. All database access
+  happens on a single dedicated thread.
+  """
+
+  def __init__(self, path: str | Path, logger: Logger):
+    self.__path = Path(path)
+    self.__logger = logger
+    self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pydisgit-ratelimit")
+    self.__db: Optional[sqlite3.Connection] = None
+
+  async def open(self) -> None:
+    await self.__run(self.__open)
+
+  async def close(self) -> None:
+    await self.__run(self.__db.close)
+    self.__executor.shutdown()
+
+  async def reserve(self, key: str) -> float:
+    """
+    Take a request from the bucket ``key``, or get how many seconds to wait before trying again
+    """
+    try:
+      return await self.__run(self.__reserve, key)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to read shared rate limits, going ahead without them")
+      return 0.0
+
+  async def update(self, key: str, remaining: Optional[int], reset_after: Optional[float]) -> None:
+    """
+    Record the state of a bucket after a response, or that it is unknown if Discord didn't tell us
+    """
+    await self.__write(self.__update, key, remaining, reset_after)
+
+  async def limited(self, key: str, retry_after: float, is_global: bool) -> None:
+    await self.__write(self.__limited, key, retry_after, is_global)
+
+  async def __write(self, func, *args) -> None:
+    try:
+      await self.__run(func, *args)
+    except sqlite3.Error:
+      self.__logger.exception("Failed to update shared rate limits")
+
+  async def __run(self, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+  # executor thread
+
+  def __open(self) -> None:
+    self.__path.parent.mkdir(parents=True, exist_ok=True)
+    self.__db = sqlite3.connect(self.__path, isolation_level=None, check_same_thread=False, timeout=5)
+    self.__db.execute("PRAGMA journal_mode=WAL")
+    # nothing here needs to survive a crash
+    self.__db.execute("PRAGMA synchronous=OFF")
+    self.__db.executescript(_SCHEMA)
+
+  def __reserve(self, key: str) -> float:
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN IMMEDIATE")
+      row = self.__db.execute("SELECT reset_at FROM global WHERE id = 0").fetchone()
+      if row is not None and row[0] > now:
+        return row[0] - now
+
+      row = self.__db.execute("SELECT remaining, reset_at FROM buckets WHERE key = ?", (key,)).fetchone()
+      if row is None or row[1] <= now:
+        # hold everyone else back until this request tells us where the bucket stands
+        self.__db.execute(
+          "INSERT OR REPLACE INTO buckets (key, remaining, reset_at) VALUES (?, 0, ?)", (key, now + _PROBE_TIMEOUT)
+        )
+        return 0.0
+
+      remaining, reset_at = row
+      if remaining <= 0:
+        return reset_at - now
+
+      self.__db.execute("UPDATE buckets SET remaining = remaining - 1 WHERE key = ?", (key,))
+      return 0.0
+
+  def __update(self, key: str, remaining: Optional[int], reset_after: Optional[float]) -> None:
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN IMMEDIATE")
+      if remaining is None or reset_after is None:
+        self.__db.execute("DELETE FROM buckets WHERE key = ?", (key,))
+        return
+
+      # other workers may have reserved requests in the same window since this response was sent
+      self.__db.execute(
+        """
+        INSERT INTO buckets (key, remaining, reset_at) VALUES (:key, :remaining, :reset_at)
+        ON CONFLICT (key) DO UPDATE SET
+          remaining = CASE WHEN abs(reset_at - :reset_at) < 1 THEN min(remaining, :remaining) ELSE :remaining END,
+          reset_at = :reset_at
+        """,
+        {"key": key, "remaining": remaining, "reset_at": now + reset_after},
+      )
+      self.__db.execute("DELETE FROM buckets WHERE reset_at < ?", (now - _STALE_BUCKET_AGE,))
+
+  def __limited(self, key: str, retry_after: float, is_global: bool) -> None:
+    reset_at = time.time() + retry_after
+    with self.__db:
+      self.__db.execute("BEGIN IMMEDIATE")
+      if is_global:
+        self.__db.execute(
+          "INSERT INTO global (id, reset_at) VALUES (0, :reset_at)"
+          " ON CONFLICT (id) DO UPDATE SET reset_at = max(reset_at, :reset_at)",
+          {"reset_at": reset_at},
+        )
+      else:
+        self.__db.execute(
+          """
+          INSERT INTO buckets (key, remaining, reset_at) VALUES (:key, 0, :reset_at)
+          ON CONFLICT (key) DO UPDATE SET remaining = 0, reset_at = max(reset_at, :reset_at)
+          """,
+          {"key": key, "reset_at": reset_at},
+        )
+
+
+class RateLimitScheduler:
+  """
+  Delays requests until Discord says they will be accepted, and retries
+  those that were rate limited, failed on Discord's end, or couldn't be sent.
+
+  Each webhook gets its own bucket, and requests within a bucket are sent
+  one at a time so that bursts queue up here rather than being rejected.
+  With ``shared`` state, buckets are also coordinated with other workers.
+  """
+
+  __buckets: dict[str, _Bucket]
+
+  def __init__(
+    self,
+    logger: Logger,
+    max_retries: int = 5,
+    max_backoff: float = 30.0,
+    max_buckets: int = 1024,
+    shared: Optional[SharedRateLimits] = None,
+  ):
+    self.__logger = logger
+    self.__shared = shared
+    self.__max_retries = max_retries
+    self.__max_backoff = max_backoff
+    self.__max_buckets = max_buckets
+    self.__buckets = {}
+    self.__global_reset_at = 0.0
+
+  async def send(self, bucket_key: str, request: Callable[[], Awaitable[Response]]) -> Response:
+    """
+    Perform ``request`` within the bucket ``bucket_key``, retrying as needed.
+
+    The last response is returned if it still failed after all retries.
+    """
+    bucket = self.__bucket(bucket_key)
+    async with bucket.lock:
+      attempt = 0
+      while True:
+        await self.__wait(bucket)
+        if self.__shared is not None:
+          await self.__wait_shared(bucket_key)
+        try:
+          response = await request()
+        except TransportError as e:
+          if self.__shared is not None:
+            await self.__shared.update(bucket_key, None, None)
+          # Discord may have acted on a request that timed out or broke off, so it's left to the spool
+          if attempt >= self.__max_retries or not isinstance(e, _UNSENT_ERRORS):
+            raise
+          self.__logger.warning("Request in bucket %s failed, retrying", bucket_key, exc_info=True)
+          await self.__sleep_backoff(attempt)
+          attempt += 1
+          continue
+
+        await self.__update(bucket_key, bucket, response)
+        if attempt >= self.__max_retries:
+          return response
+
+        if response.status_code == 429:
+          await self.__limited(bucket_key, bucket, response)
+        elif response.status_code >= 500:
+          self.__logger.warning("Discord returned %d in bucket %s, retrying", response.status_code, bucket_key)
+          await self.__sleep_backoff(attempt)
+        else:
+          return response
+
+        attempt += 1
+
+  def __bucket(self, key: str) -> _Bucket:
+    bucket = self.__buckets.get(key)
+    if bucket is None:
+      if len(self.__buckets) >= self.__max_buckets:
+        self.__evict_idle()
+      bucket = self.__buckets[key] = _Bucket()
+    return bucket
+
+  def __evict_idle(self) -> None:
+    now = time.monotonic()
+    for key, bucket in list(self.__buckets.items()):
+      if not bucket.lock.locked() and bucket.reset_at <= now:
+        del self.__buckets[key]
+
+  async def __wait(self, bucket: _Bucket) -> None:
+    waited = 0.0
+    reason = "bucket"
+    while True:
+      now = time.monotonic()
+      until = self.__global_reset_at
+      if until > now:
+        reason = "global"
+      if bucket.remaining == 0:
+        until = max(until, bucket.reset_at)
+      if until <= now:
+        break
+      await asyncio.sleep(until - now)
+      waited += time.monotonic() - now
+
+    if waited:
+      RATE_LIMIT_WAIT_SECONDS.observe(waited, reason)
+
+  async def __wait_shared(self, bucket_key: str) -> None:
+    waited = 0.0
+    while (delay := await self.__shared.reserve(bucket_key)) > 0:
+      delay = min(delay, _POLL_INTERVAL)
+      await asyncio.sleep(delay)
+      waited += delay
+
+    if waited:
+      RATE_LIMIT_WAIT_SECONDS.observe(waited, "shared")
+
+  async def __update(self, bucket_key: str, bucket: _Bucket, response: Response) -> None:
+    headers = response.headers
+    remaining = headers.get("x-ratelimit-remaining")
+    reset_after = headers.get("x-ratelimit-reset-after")
+    try:
+      remaining = int(remaining) if remaining is not None else None
+      reset_after = float(reset_after) if reset_after is not None else None
+    except ValueError:
+      remaining = reset_after = None
+
+    if remaining is not None and reset_after is not None:
+      bucket.remaining = remaining
+      bucket.reset_at = time.monotonic() + reset_after
+    if self.__shared is not None:
+      await self.__shared.update(bucket_key, remaining, reset_after)
+
+  async def __limited(self, bucket_key: str, bucket: _Bucket, response: Response) -> None:
+    retry_after = None
+    is_global = response.headers.get("x-ratelimit-global", "").lower() == "true"
+    try:
+      body = response.json()
+      retry_after = float(body["retry_after"])
+      is_global = is_global or bool(body.get("global", False))
+    except (ValueError, KeyError, TypeError):
+      pass
+
+    if retry_after is None:
+      try:
+        retry_after = float(response.headers.get("retry-after", 1))
+      except ValueError:
+        retry_after = 1.0
+
+    jitter = random.uniform(0, 0.25)
+    if self.__shared is not None:
+      await self.__shared.limited(bucket_key, retry_after + jitter, is_global)
+
+    reset_at = time.monotonic() + retry_after + jitter
+    if is_global:
+      self.__logger.warning("Hit global rate limit, pausing all requests for %.2fs", retry_after)
+      self.__global_reset_at = max(self.__global_reset_at, reset_at)
+    else:
+      self.__logger.info("Rate limited in bucket %s, retrying in %.2fs", bucket_key, retry_after)
+      bucket.remaining = 0
+      bucket.reset_at = max(bucket.reset_at, reset_at)
+
+  async def __sleep_backoff(self, attempt: int) -> None:
+    # full jitter
+    delay = random.uniform(0, min(self.__max_backoff, 0.5 * 2**attempt))
+    await asyncio.sleep(delay)
+    RATE_LIMIT_WAIT_SECONDS.observe(delay, "backoff")
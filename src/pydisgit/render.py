@@ -0,0 +1,121 @@
+"""
+Rendering large payloads away from the event loop.
+
+Decoding and rendering run synchronously, so a huge push or gollum payload
+would otherwise hold up every other request, health checks included, until
+it's done. Payloads over a size threshold are handed to a pool instead: a
+process pool, so rendering happens entirely in parallel, or a thread pool,
+which only keeps the loop ticking between slices of the GIL.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import Logger
+from typing import Any, Optional
+
+from .conf import BoundEnv
+from .webhook import BoundRouter
+
+# the router in a pool process, bound once when the process starts
+_router: Optional[BoundRouter] = None
+
+
+def _init_process(config: dict[str, Any]) -> None:
+  global _router
+  from .handlers import router
+
+  logger = logging.getLogger("pydisgit.render")
+  _router = router.bind(BoundEnv(config, logger), logger)
+
+
+def _warm_up() -> None:
+  pass
+
+
+def _process_request(gh_hook_type: str, gh_data: bytes) -> Optional[Any]:
+  return _router.process_request(gh_hook_type, gh_data)
+
+
+class RenderPool:
+  """
+  Workers that render payloads of at least ``threshold`` bytes.
+
+  ``kind`` is either ``process`` or ``thread``. Process workers bind their own
+  router from ``config``, so timings from handlers they run aren't recorded in
+  this process's metrics.
+  """
+
+  __executor: Optional[Executor]
+
+  def __init__(
+    self, kind: str, workers: int, threshold: int, router: BoundRouter, config: dict[str, Any], logger: Logger
+  ):
+    if kind not in ("process", "thread"):
+      raise ValueError(f"Unknown render pool kind '{kind}', expected 'process' or 'thread'")
+
+    self.__kind = kind
+    self.__workers = workers
+    self.__threshold = threshold
+    self.__router = router
+    self.__config = config
+    self.__logger = logger
+    self.__executor = None
+
+  def wants(self, gh_data: bytes) -> bool:
+    """
+    Whether a payload is large enough to be rendered in the pool
+    """
+    return len(gh_data) >= self.__threshold
+
+  async def start(self) -> None:
+    """
+    Start every worker, and wait until they are ready to render
+    """
+    self.__executor = self.__create_executor()
+    if self.__kind == "process":
+      loop = asyncio.get_running_loop()
+      # processes start as work arrives, so give each of them something to do
+      await asyncio.gather(*(loop.run_in_executor(self.__executor, _warm_up) for _ in range(self.__workers)))
+    self.__logger.info(
+      "Rendering payloads over %d bytes in %d %s workers", self.__threshold, self.__workers, self.__kind
+    )
+
+  async def stop(self) -> None:
+    if self.__executor is not None:
+      self.__executor.shutdown(wait=False, cancel_futures=True)
+      self.__executor = None
+
+  async def process_request(self, gh_hook_type: str, gh_data: bytes) -> Optional[Any]:
+    """
+    Render a payload in the pool, the same as ``BoundRouter.process_request``
+    """
+    loop = asyncio.get_running_loop()
+    if self.__kind == "thread":
+      return await loop.run_in_executor(self.__executor, self.__router.process_request, gh_hook_type, gh_data)
+
+    executor = self.__executor
+    try:
+      return await loop.run_in_executor(executor, _process_request, gh_hook_type, gh_data)
+    except BrokenProcessPool:
+      # a worker died, maybe from running out of memory, which takes the whole pool with it. The payload isn't
+      # retried here, since it may well be what killed the worker
+      if self.__executor is executor:
+        self.__logger.error("Render pool broke while rendering %s, starting a new one", gh_hook_type)
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.__executor = self.__create_executor()
+      raise
+
+  def __create_executor(self) -> Executor:
+    if self.__kind == "thread":
+      return ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix="pydisgit-render")
+
+    # forking a process that already has threads running isn't safe
+    return ProcessPoolExecutor(
+      max_workers=self.__workers,
+      mp_context=multiprocessing.get_context("spawn"),
+      initializer=_init_process,
+      initargs=(self.__config,),
+    )
@@ -0,0 +1,82 @@
+"""
+Named routes, each sending one GitHub webhook to several Discord webhooks.
+
+Routes are read from a TOML file, such as::
+
+  [routes.adventure]
+  destinations = [
+    { name = "commits", hook_id = "1234", token = "abcd", events = ["push"] },
+    { name = "reviews", hook_id = "5678", token = "efgh", events = ["pull_request", "pull_request_review"] },
+    { name = "releases", hook_id = "9012", token = "ijkl", events = ["release:released"] },
+  ]
+
+A destination with no ``events`` gets everything. Otherwise, entries are
+either an event name, or an event and action separated by ``:``.
+"""
+
+import tomllib
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+
+class Destination(NamedTuple):
+  """
+  A Discord webhook messages on a route are sent to
+  """
+
+  name: str
+  hook_id: str
+  token: str
+  events: Optional[frozenset[str]] = None
+
+  def accepts(self, event: str, action: Optional[str]) -> bool:
+    if self.events is None:
+      return True
+    return event in self.events or (action is not None and f"{event}:{action}" in self.events)
+
+
+class Route(NamedTuple):
+  name: str
+  destinations: tuple[Destination, ...]
+
+  def destinations_for(self, event: str, action: Optional[str]) -> list[Destination]:
+    return [d for d in self.destinations if d.accepts(event, action)]
+
+
+def _destination(route: str, index: int, raw: dict) -> Destination:
+  try:
+    hook_id = str(raw["hook_id"])
+    token = str(raw["token"])
+  except (KeyError, TypeError) as e:
+    raise ValueError(f"Destination {index} of route '{route}' needs a hook_id and token") from e
+
+  events = raw.get("events")
+  if isinstance(events, str):
+    events = [events]
+  return Destination(
+    str(raw.get("name", index)),
+    hook_id,
+    token,
+    frozenset(events) if events is not None else None,
+  )
+
+
+def parse_routes(data: dict) -> dict[str, Route]:
+  """
+  Read routes from the contents of a routes file
+  """
+  routes = {}
+  for name, raw in (data.get("routes") or {}).items():
+    destinations = raw.get("destinations") if isinstance(raw, dict) else None
+    if not destinations:
+      raise ValueError(f"Route '{name}' has no destinations")
+    routes[name] = Route(name, tuple(_destination(name, i, d) for i, d in enumerate(destinations)))
+  return routes
+
+
+def load_routes(path: str | Path) -> dict[str, Route]:
+  """
+  Read routes from a TOML file
+  """
+  with open(path, "rb") as f:
+    return parse_routes(tomllib.load(f))
@@ -0,0 +1,713 @@
+"""
+The web app, built by ``create_app``.
+
+Modules only some configurations need, such as the spool, the render pool or
+the HTTP client's dependencies, are imported when they're set up rather than
+here, so that starting up only pays for what is used.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from functools import partial, wraps
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Optional
+
+from quart import Blueprint, Quart, Response, current_app, g, make_response, request
+from werkzeug.exceptions import BadRequest, NotFound, RequestEntityTooLarge
+
+from . import metrics
+from .codec import JsonCodec, select_codec
+from .conf import BoundEnv, Config
+from .form import FormPayloadDecoder, form_payload
+from .hmac import HmacVerifyMiddleware, verified_body
+from .webhook import BoundRouter, PayloadError, payload_repository
+
+if TYPE_CHECKING:
+  from httpx import AsyncClient
+  from httpx import Response as ClientResponse
+
+  from .checks import CheckRunAggregator
+  from .coalesce import Coalescer
+  from .dedup import DeliveryCache
+  from .delivery import Delivery, DeliveryQueue
+  from .discord import DiscordClient  # noqa: F401
+  from .messages import MessageStore
+  from .ratelimit import RateLimitScheduler, SharedRateLimits  # noqa: F401
+  from .render import RenderPool
+  from .routes import Destination, Route
+  from .spool import Spool
+  from .throttle import Throttle
+
+Quart.__annotations__["bound"] = BoundEnv
+Quart.__annotations__["codec"] = JsonCodec
+Quart.__annotations__["handler_router"] = BoundRouter
+Quart.__annotations__["routes"] = dict[str, "Route"]
+Quart.__annotations__["http_client"] = "AsyncClient"
+Quart.__annotations__["rate_limiter"] = "RateLimitScheduler"
+Quart.__annotations__["discord"] = "DiscordClient"
+Quart.__annotations__["delivery_queue"] = Optional["DeliveryQueue"]
+Quart.__annotations__["coalescer"] = Optional["Coalescer"]
+Quart.__annotations__["spool"] = Optional["Spool"]
+Quart.__annotations__["fanout_limit"] = asyncio.Semaphore
+Quart.__annotations__["delivery_cache"] = Optional["DeliveryCache"]
+Quart.__annotations__["shared_rate_limits"] = Optional["SharedRateLimits"]
+Quart.__annotations__["spool_replay"] = Optional[asyncio.Task]
+Quart.__annotations__["render_pool"] = Optional["RenderPool"]
+Quart.__annotations__["throttle"] = Optional["Throttle"]
+Quart.__annotations__["check_runs"] = Optional["CheckRunAggregator"]
+Quart.__annotations__["messages"] = Optional["MessageStore"]
+
+views = Blueprint("pydisgit", __name__)
+
+
+def create_app() -> Quart:
+  """
+  Create the app, configured from ``PYDISGIT_`` environment variables
+  """
+  app = Quart("pydisgit")
+  app.delivery_queue = None
+  app.coalescer = None
+  app.spool = None
+  app.delivery_cache = None
+  app.shared_rate_limits = None
+  app.spool_replay = None
+  app.render_pool = None
+  app.throttle = None
+  app.check_runs = None
+  app.messages = None
+
+  # config setup
+  app.config.from_object(Config)
+  app.config.from_prefixed_env(prefix="PYDISGIT")
+  # unsigned bodies never pass through the HMAC middleware, so have quart hold them to the same limit
+  app.config["MAX_CONTENT_LENGTH"] = app.config["MAX_BODY_SIZE"]
+
+  app.bound = BoundEnv(app.config, app.logger)
+  app.codec = select_codec(app.config["JSON_BACKEND"])
+  app.logger.info("Using %s for JSON", app.codec.name)
+  app.asgi_app = HmacVerifyMiddleware(app.asgi_app, app.bound.github_webhook_secret, app.config["MAX_BODY_SIZE"])
+
+  from .handlers import router as free_handler_router
+
+  app.handler_router = free_handler_router.bind(app.bound, app.logger)
+
+  app.routes = {}
+  if app.config["ROUTES_FILE"]:
+    from .routes import load_routes
+
+    # a route's name is all it takes to post to every channel on it, so only signed webhooks may use one
+    if not app.bound.github_webhook_secret:
+      raise ValueError("PYDISGIT_ROUTES_FILE needs PYDISGIT_GITHUB_WEBHOOK_SECRET to be set as well")
+
+    app.routes = load_routes(app.config["ROUTES_FILE"])
+    app.logger.info("Loaded %d routes from %s", len(app.routes), app.config["ROUTES_FILE"])
+
+  metrics.QUEUE_DEPTH.set_function(lambda: app.delivery_queue.depth if app.delivery_queue is not None else 0)
+
+  app.register_blueprint(views)
+  return app
+
+
+def _app() -> Quart:
+  # the proxy is unwrapped once, rather than on every attribute access
+  return current_app._get_current_object()
+
+
+# render pool
+
+
+@views.before_app_serving
+async def setup_render_pool():
+  app = _app()
+  if app.config["RENDER_POOL"]:
+    from .render import RenderPool
+
+    app.render_pool = RenderPool(
+      app.config["RENDER_POOL"],
+      app.config["RENDER_WORKERS"],
+      app.config["RENDER_POOL_THRESHOLD"],
+      app.handler_router,
+      {key: app.config[key] for key in vars(Config) if key.isupper()},
+      app.logger,
+    )
+    await app.render_pool.start()
+
+
+@views.after_app_serving
+async def teardown_render_pool():
+  app = _app()
+  if app.render_pool is not None:
+    await app.render_pool.stop()
+    app.render_pool = None
+
+
+# http client
+
+
+@views.before_app_serving
+async def setup_httpclient():
+  from .discord import DiscordClient
+  from .ratelimit import RateLimitScheduler
+
+  app = _app()
+  shared_state = app.config["SHARED_STATE_DIR"]
+  if shared_state:
+    from .ratelimit import SharedRateLimits
+
+    app.shared_rate_limits = SharedRateLimits(Path(shared_state) / "ratelimits.sqlite3", app.logger)
+    await app.shared_rate_limits.open()
+
+  app.http_client = create_http_client(app)
+  app.rate_limiter = RateLimitScheduler(app.logger, app.config["DISCORD_MAX_RETRIES"], shared=app.shared_rate_limits)
+  app.discord = DiscordClient(app.http_client, app.rate_limiter, app.codec, app.config["DISCORD_API_BASE"])
+  metrics.HTTP_IN_FLIGHT.set_function(lambda: app.discord.in_flight)
+  app.fanout_limit = asyncio.Semaphore(app.config["FANOUT_CONCURRENCY"])
+
+  if app.config["SPOOL_DIR"]:
+    from .spool import Spool
+
+    app.spool = Spool(
+      app.config["SPOOL_DIR"],
+      app.codec,
+      app.logger,
+      app.config["SPOOL_COMMIT_INTERVAL_MS"] / 1000,
+      app.config["SPOOL_BATCH_SIZE"],
+      shared=bool(shared_state),
+      lease=app.config["SPOOL_LEASE"],
+    )
+    await app.spool.open()
+
+  if app.config["DELIVERY_QUEUE"]:
+    from .delivery import DeliveryQueue
+
+    app.delivery_queue = DeliveryQueue(
+      app.discord,
+      app.spool,
+      app.logger,
+      app.config["DELIVERY_QUEUE_SIZE"],
+      app.config["DELIVERY_WORKERS"],
+    )
+    await app.delivery_queue.start()
+
+  if app.config["COALESCE_WINDOW_MS"] > 0:
+    from .coalesce import Coalescer
+
+    app.coalescer = Coalescer(
+      direct_delivery_sink(app),
+      app.logger,
+      app.config["COALESCE_WINDOW_MS"] / 1000,
+      app.config["DELIVERY_QUEUE_SIZE"],
+    )
+
+  if app.config["THROTTLE"]:
+    from .throttle import Throttle, parse_rules
+
+    app.throttle = Throttle(
+      parse_rules(app.config["THROTTLE"]),
+      direct_delivery_sink(app),
+      app.logger,
+      app.config["THROTTLE_MAX_KEYS"],
+    )
+
+  if app.config["CHECK_RUN_WINDOW"] > 0:
+    from .checks import CheckRunAggregator
+
+    app.check_runs = CheckRunAggregator(
+      app.discord,
+      app.logger,
+      app.config["CHECK_RUN_WINDOW"],
+      app.config["CHECK_RUN_EDIT"],
+      app.config["CHECK_RUN_MAX_SUITES"],
+    )
+
+  if app.config["EDIT_IN_PLACE"]:
+    from .messages import MessageStore
+
+    messages_file = app.config["EDIT_IN_PLACE_FILE"]
+    if not messages_file:
+      if shared_state:
+        messages_file = Path(shared_state) / "messages.sqlite3"
+      else:
+        app.logger.warning("No PYDISGIT_EDIT_IN_PLACE_FILE set, messages to edit will be forgotten on restart")
+        messages_file = ":memory:"
+    app.messages = MessageStore(
+      messages_file,
+      app.logger,
+      app.config["EDIT_IN_PLACE_MAX_ENTRIES"],
+      app.config["EDIT_IN_PLACE_TTL"],
+    )
+    await app.messages.open()
+
+  if app.config["DELIVERY_CACHE_SIZE"] > 0:
+    cache_file = app.config["DELIVERY_CACHE_FILE"]
+    if not cache_file and shared_state:
+      cache_file = Path(shared_state) / "deliveries.sqlite3"
+    if cache_file:
+      from .dedup import SqliteDeliveryCache
+
+      app.delivery_cache = SqliteDeliveryCache(
+        cache_file,
+        app.logger,
+        app.config["DELIVERY_CACHE_SIZE"],
+        app.config["DELIVERY_CACHE_TTL"],
+      )
+    else:
+      from .dedup import DeliveryCache
+
+      app.delivery_cache = DeliveryCache(app.config["DELIVERY_CACHE_SIZE"], app.config["DELIVERY_CACHE_TTL"])
+    await app.delivery_cache.open()
+
+  if app.spool is not None:
+    app.spool_replay = asyncio.create_task(replay_spool(app), name="pydisgit-spool-replay")
+
+  if app.config["HTTP_WARMUP"]:
+    app.add_background_task(app.discord.warm_up, app.logger)
+
+
+def create_http_client(app: Quart) -> "AsyncClient":
+  """
+  Create the client used for Discord, with its connection pool set up from config
+  """
+  import importlib.util
+
+  from httpx import AsyncClient, Limits, Timeout
+
+  http2 = app.config["HTTP2"]
+  if http2 and importlib.util.find_spec("h2") is None:
+    app.logger.warning("HTTP/2 was requested but the h2 package is not installed, using HTTP/1.1")
+    http2 = False
+
+  return AsyncClient(
+    headers={"User-Agent": "pydisgit (kyori flavour)"},
+    http2=http2,
+    limits=Limits(
+      max_connections=app.config["HTTP_MAX_CONNECTIONS"],
+      max_keepalive_connections=app.config["HTTP_MAX_KEEPALIVE_CONNECTIONS"],
+      keepalive_expiry=app.config["HTTP_KEEPALIVE_EXPIRY"],
+    ),
+    timeout=Timeout(
+      connect=app.config["HTTP_CONNECT_TIMEOUT"],
+      read=app.config["HTTP_READ_TIMEOUT"],
+      write=app.config["HTTP_WRITE_TIMEOUT"],
+      pool=app.config["HTTP_POOL_TIMEOUT"],
+    ),
+  )
+
+
+def direct_delivery_sink(app: Quart) -> Callable[["Delivery"], Awaitable[None]]:
+  """
+  Where to send deliveries that don't have a webhook request waiting on them
+  """
+  from .delivery import deliver
+
+  if app.delivery_queue is not None:
+    return app.delivery_queue.put
+  return partial(deliver, app.discord, app.spool, app.logger)
+
+
+async def replay_spool(app: Quart):
+  """
+  Send everything left over in the spool from a previous run.
+
+  When the spool is shared with other workers, keep picking up messages from any that stop without delivering them.
+  """
+  sink = direct_delivery_sink(app)
+  while True:
+    pending = await app.spool.pending()
+    if pending:
+      app.logger.info("Replaying %d undelivered messages from the spool", len(pending))
+
+    for delivery in pending:
+      await sink(delivery)
+
+    if not app.config["SHARED_STATE_DIR"]:
+      return
+    await asyncio.sleep(app.spool.lease)
+
+
+@views.after_app_serving
+async def teardown_httpclient():
+  app = _app()
+  if app.spool_replay is not None:
+    app.spool_replay.cancel()
+    await asyncio.gather(app.spool_replay, return_exceptions=True)
+    app.spool_replay = None
+
+  if app.throttle is not None:
+    await app.throttle.stop()
+    app.throttle = None
+
+  if app.check_runs is not None:
+    await app.check_runs.stop()
+    app.check_runs = None
+
+  if app.coalescer is not None:
+    await app.coalescer.stop()
+    app.coalescer = None
+
+  if app.delivery_queue is not None:
+    await app.delivery_queue.stop()
+    app.delivery_queue = None
+
+  if app.spool is not None:
+    await app.spool.close()
+    app.spool = None
+
+  if app.delivery_cache is not None:
+    await app.delivery_cache.close()
+    app.delivery_cache = None
+
+  if app.messages is not None:
+    await app.messages.close()
+    app.messages = None
+
+  await app.http_client.aclose()
+
+  if app.shared_rate_limits is not None:
+    await app.shared_rate_limits.close()
+    app.shared_rate_limits = None
+
+
+@views.get("/")
+async def hello() -> str:
+  """
+  root handler
+  """
+  return "begone foul beast", 400
+
+
+# outcomes that handling a delivery again would not change
+_FINAL_OUTCOMES = frozenset({"ignored", "queued", "aggregated", "throttled", "delivered", "edited"})
+# deliveries being handled right now, so that a redelivery can wait for the original
+_in_flight: dict[str, asyncio.Event] = {}
+
+
+def deduplicated(view: Callable) -> Callable:
+  """
+  Answer redeliveries of a GitHub delivery with the response it got the first time, rather than handling it again
+  """
+
+  @wraps(view)
+  async def wrapper(*args, **kwargs):
+    from .dedup import CachedResponse
+
+    app = _app()
+    delivery = request.headers.get("X-GitHub-Delivery")
+    if app.delivery_cache is None or not delivery:
+      return await view(*args, **kwargs)
+
+    key = f"{request.path}:{delivery}"
+    while (pending := _in_flight.get(key)) is not None:
+      await pending.wait()
+
+    _in_flight[key] = done = asyncio.Event()
+    try:
+      cached = await app.delivery_cache.get(key)
+      if cached is not None:
+        g.event = request.headers.get("X-GitHub-Event", "")
+        g.outcome = "duplicate"
+        return Response(cached.body, status=cached.status, content_type=cached.content_type)
+
+      response = await make_response(await view(*args, **kwargs))
+      outcome = g.get("outcome")
+      # a route is final once every destination is, whatever mix of outcomes they had
+      if g.get("final", outcome in _FINAL_OUTCOMES):
+        body = await response.get_data()
+        await app.delivery_cache.put(key, CachedResponse(outcome, response.status_code, response.content_type, body))
+      return response
+    finally:
+      del _in_flight[key]
+      done.set()
+
+  return wrapper
+
+
+async def render_request() -> Optional[Any]:
+  """
+  Render the webhook in the current request into a message, or ``None`` if there's nothing to send
+  """
+  app = _app()
+  handler_router = app.handler_router
+  event = request.headers["X-GitHub-Event"]
+  if not event or not request.content_type:
+    raise BadRequest("No event or content type")
+
+  g.event = event
+  # check suites have no message of their own, but tell us when to send a summary of their check runs
+  suite_event = event == "check_suite" and app.check_runs is not None
+
+  # turn away events we'd never render before doing anything with the body
+  if not suite_event and not handler_router.accepts(event):
+    g.outcome = "ignored"
+    return None
+
+  # signed requests have already had their body read by the HMAC middleware
+  body = verified_body(request.scope)
+  start = perf_counter()
+
+  # payloads are decoded by the handlers themselves, which only pick out what they need
+  try:
+    if "application/json" in request.content_type:
+      payload = body if body is not None else await request.get_data(cache=False)
+    elif "application/x-www-form-urlencoded" in request.content_type:
+      payload = form_payload(body) if body is not None else await stream_form_payload()
+    else:
+      raise BadRequest(f"Unknown content type {request.content_type}")
+  except RequestEntityTooLarge:
+    g.outcome = "too_large"
+    raise
+  except ValueError as e:
+    raise BadRequest("Malformed payload") from e
+
+  try:
+    if suite_event:
+      app.check_runs.suite_event(payload)
+      g.outcome = "ignored"
+      return None
+
+    action = handler_router.action(event, payload)
+    g.action = action or ""
+    metrics.STAGE_SECONDS.since(start, "parse")
+    if not handler_router.accepts_action(event, action):
+      g.outcome = "ignored"
+      return None
+
+    start = perf_counter()
+    if app.render_pool is not None and app.render_pool.wants(payload):
+      embed = await app.render_pool.process_request(event, payload)
+    else:
+      embed = handler_router.process_request(event, payload)
+    metrics.STAGE_SECONDS.since(start, "process_request")
+
+    if embed and app.check_runs is not None and event == "check_run" and action == "completed":
+      from .checks import decode_check_run
+
+      g.check_run = decode_check_run(payload)
+    elif embed and app.messages is not None and event in ("pull_request", "issues"):
+      from .messages import LIFECYCLE_ACTIONS, thread_key
+
+      if action in LIFECYCLE_ACTIONS:
+        g.thread = thread_key(event, payload)
+    elif embed and app.throttle is not None and app.throttle.covers(event):
+      g.repository = payload_repository(payload)
+  except PayloadError as e:
+    raise BadRequest(str(e)) from e
+  if not embed:
+    g.outcome = "ignored"
+    return None
+
+  if app.config["DEBUG"]:
+    import pprint
+
+    pprint.pprint(embed)
+    # embed = await bound.buildDebugPaste(embed)
+
+  return embed
+
+
+async def stream_form_payload() -> bytes:
+  """
+  Pick the payload out of a form encoded request as its body arrives, without keeping the rest of the form
+  """
+  max_body_size = _app().config["MAX_BODY_SIZE"]
+  decoder = FormPayloadDecoder()
+  size = 0
+  async for chunk in request.body:
+    # quart only limits how much is buffered at once, not the size of a body that's being streamed
+    size += len(chunk)
+    if size > max_body_size:
+      raise RequestEntityTooLarge()
+    decoder.feed(chunk)
+    if decoder.done:
+      break
+  return decoder.finish()
+
+
+async def send(hook_id: str, token: str, embed: Any) -> tuple[str, Optional["ClientResponse"]]:
+  """
+  Send a rendered message to a Discord webhook, or queue it for delivery.
+
+  Returns the outcome, plus Discord's response if the message was sent right away.
+  """
+  from .delivery import Delivery, is_settled
+
+  app = _app()
+  if (check_run := g.get("check_run")) is not None:
+    app.check_runs.add(hook_id, token, check_run)
+    return "aggregated", None
+
+  if (thread := g.get("thread")) is not None:
+    return await send_to_thread(hook_id, token, thread, embed)
+
+  if app.throttle is not None and not app.throttle.admit(hook_id, token, g.get("repository"), g.event, embed):
+    return "throttled", None
+
+  delivery = Delivery(hook_id, token, embed)
+  if app.spool is not None:
+    delivery = delivery._replace(spool_ids=(await app.spool.append(delivery),))
+
+  if app.coalescer is not None or app.delivery_queue is not None:
+    if not (app.coalescer or app.delivery_queue).submit(delivery):
+      if app.spool is not None:
+        app.spool.settle(delivery.spool_ids)
+      return "queue_full", None
+    return "queued", None
+
+  result = await app.discord.execute_webhook(hook_id, token, embed)
+  if app.spool is not None and is_settled(result):
+    app.spool.settle(delivery.spool_ids)
+
+  return "delivered" if result.is_success else "failed", result
+
+
+async def send_to_thread(hook_id: str, token: str, thread: str, embed: Any) -> tuple[str, "ClientResponse"]:
+  """
+  Send the message for a pull request or issue, editing the one sent for it before if there is one.
+
+  These are always sent right away, since Discord's response has the id of the message to edit next time.
+  They aren't spooled either, as a replay would post a new message rather than edit. When one fails,
+  GitHub is told so, and a redelivery goes through here again.
+  """
+  app = _app()
+  key = f"{hook_id}/{thread}"
+  async with app.messages.lock(key):
+    outcome = "delivered"
+    message_id = await app.messages.get(key)
+    result = None
+    if message_id is not None:
+      result = await app.discord.edit_message(hook_id, token, message_id, embed)
+      outcome = "edited"
+      # the message was deleted, so send a new one
+      if result.status_code == 404:
+        message_id = result = None
+        outcome = "delivered"
+
+    if result is None:
+      result = await app.discord.execute_webhook(hook_id, token, embed, wait=True)
+      if result.is_success:
+        message_id = result.json().get("id")
+
+    if not result.is_success:
+      return "failed", result
+
+    # editing a message keeps it around for longer
+    if message_id is not None:
+      await app.messages.put(key, message_id)
+    return outcome, result
+
+
+@views.post("/<hook_id>/<token>")
+@deduplicated
+async def gh_hook(hook_id: str, token: str) -> dict:
+  embed = await render_request()
+  if not embed:
+    return "Webhook NO-OP", 200
+
+  g.outcome, result = await send(hook_id, token, embed)
+  if g.outcome == "queue_full":
+    return "Delivery queue is full", 503
+  if g.outcome == "aggregated":
+    return {"message": f"Webhook {hook_id} check run added to the summary for its commit"}, 202
+  if g.outcome == "throttled":
+    return {"message": f"Webhook {hook_id} throttled, it will be counted in the next digest"}, 202
+  if result is None:
+    return {"message": f"Webhook {hook_id} queued for delivery"}, 202
+
+  if result.status_code in (200, 204):
+    result_text = result.text
+    return {"message": f"We won! Webhook {hook_id} executed with token {token} :3, response: {result_text}"}, 200
+  else:
+    return Response(
+      response=await result.aread(),
+      status=result.status_code,
+      content_type=result.headers["content-type"],
+      headers=result.headers,
+    )
+
+
+@views.post("/route/<name>")
+@deduplicated
+async def route_hook(name: str) -> dict:
+  """
+  Render a webhook once and send it to every destination on a route
+  """
+  from httpx import HTTPError
+
+  from .dedup import CachedResponse
+
+  app = _app()
+  route = app.routes.get(name)
+  if route is None:
+    raise NotFound(f"No route named {name}")
+
+  embed = await render_request()
+  if not embed:
+    return "Webhook NO-OP", 200
+
+  destinations = route.destinations_for(g.event, g.get("action") or None)
+  if not destinations:
+    g.outcome = "ignored"
+    return "Webhook NO-OP", 200
+
+  # destinations are remembered separately, so that redelivering a partly failed fan-out only retries the failures
+  delivery = request.headers.get("X-GitHub-Delivery") if app.delivery_cache is not None else None
+
+  async def send_to(destination: "Destination") -> dict:
+    key = f"route:{name}:{destination.name}:{delivery}"
+    if delivery and (cached := await app.delivery_cache.get(key)) is not None:
+      return {**app.codec.loads(cached.body), "outcome": "duplicate"}
+
+    async with app.fanout_limit:
+      try:
+        outcome, result = await send(destination.hook_id, destination.token, embed)
+      except HTTPError as e:
+        app.logger.warning("Failed to deliver to %s on route %s: %s", destination.name, name, e)
+        return {"destination": destination.name, "outcome": "failed", "error": str(e)}
+
+    sent = {"destination": destination.name, "outcome": outcome}
+    if result is not None:
+      sent["status"] = result.status_code
+    if delivery and outcome in _FINAL_OUTCOMES:
+      body = app.codec.dumps(sent)
+      await app.delivery_cache.put(key, CachedResponse(outcome, sent.get("status", 0), "application/json", body))
+    return sent
+
+  results = await asyncio.gather(*(send_to(d) for d in destinations))
+
+  outcomes = {r["outcome"] for r in results}
+  g.outcome = next(iter(outcomes)) if len(outcomes) == 1 else "partial"
+  g.final = outcomes <= _FINAL_OUTCOMES | {"duplicate"}
+  if outcomes & {"failed", "queue_full"}:
+    status = 502
+  elif outcomes <= {"delivered", "edited", "duplicate"}:
+    status = 200
+  else:
+    status = 202
+  return {"route": name, "results": results}, status
+
+
+@views.after_app_request
+async def count_webhook(response: Response) -> Response:
+  if request.endpoint in ("pydisgit.gh_hook", "pydisgit.route_hook"):
+    outcome = g.get("outcome") or ("error" if response.status_code >= 500 else "invalid")
+    metrics.REQUESTS.inc(g.get("event", ""), g.get("action", ""), outcome)
+  return response
+
+
+@views.get("/metrics")
+async def prometheus_metrics() -> Response:
+  """
+  metrics in the Prometheus text format
+  """
+  if not _app().config["METRICS"]:
+    raise NotFound()
+  return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@views.get("/health")
+async def health_check() -> str:
+  """
+  simple aliveness check
+  """
+  return "OK"
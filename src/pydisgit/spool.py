@@ -0,0 +1,210 @@
+"""
+Durable on-disk spool of messages that have not yet been delivered to Discord
+"""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+
+from .codec import JsonCodec
+from .delivery import Delivery
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  hook_id TEXT NOT NULL,
+  token TEXT NOT NULL,
+  body BLOB NOT NULL,
+  created REAL NOT NULL,
+  owner TEXT,
+  leased_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+class Spool:
+  """
+  SQLite-backed log of messages waiting on Discord.
+
+  Messages are written before GitHub is acknowledged and removed once Discord
+  has settled them, so anything left over after a restart can be replayed.
+  Writes from concurrent requests are grouped into a single transaction, so
+  a burst of events shares one WAL sync rather than paying for one each.
+
+  Every message is leased to the process that wrote it, and the lease is
+  renewed for as long as that process is alive. When the spool is ``shared``
+  between worker processes, only messages whose lease has run out are
+  replayed, so that workers don't send each other's messages. Otherwise,
+  everything left over is replayed.
+
+  All database access happens on a single dedicated thread.
+  """
+
+  __appends: list[tuple[Delivery, asyncio.Future]]
+  __settled: list[int]
+
+  def __init__(
+    self,
+    directory: str,
+    codec: JsonCodec,
+    logger: Logger,
+    commit_interval: float,
+    batch_size: int,
+    shared: bool = False,
+    lease: float = 60.0,
+  ):
+    self.__path = Path(directory) / "spool.sqlite3"
+    self.__codec = codec
+    self.__logger = logger
+    self.__commit_interval = commit_interval
+    self.__batch_size = batch_size
+    self.__shared = shared
+    self.__lease = lease
+    self.__owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    self.__appends = []
+    self.__settled = []
+    self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pydisgit-spool")
+    self.__db: Optional[sqlite3.Connection] = None
+    self.__writer: Optional[asyncio.Task] = None
+    self.__renewer: Optional[asyncio.Task] = None
+    self.__wakeup = asyncio.Event()
+    self.__full = asyncio.Event()
+
+  async def open(self) -> None:
+    await self.__run(self.__open)
+    self.__writer = asyncio.create_task(self.__write_loop(), name="pydisgit-spool-writer")
+    self.__renewer = asyncio.create_task(self.__renew_loop(), name="pydisgit-spool-lease")
+
+  @property
+  def lease(self) -> float:
+    return self.__lease
+
+  async def close(self) -> None:
+    """
+    Commit anything outstanding and close the database
+    """
+    for task in (self.__writer, self.__renewer):
+      if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    self.__writer = self.__renewer = None
+    await self.__commit()
+    await self.__run(self.__db.close)
+    self.__executor.shutdown()
+
+  async def append(self, delivery: Delivery) -> int:
+    """
+    Durably record a delivery, returning its spool id once it has been committed
+    """
+    future = asyncio.get_running_loop().create_future()
+    self.__appends.append((delivery, future))
+    self.__wakeup.set()
+    if len(self.__appends) >= self.__batch_size:
+      self.__full.set()
+    return await future
+
+  def settle(self, ids: tuple[int, ...]) -> None:
+    """
+    Mark deliveries as no longer needing to be sent. This is committed with the next batch of writes.
+    """
+    if ids:
+      self.__settled.extend(ids)
+      self.__wakeup.set()
+
+  async def pending(self) -> list[Delivery]:
+    """
+    Take over every delivery that has not been settled and isn't held by another live process
+    """
+    return await self.__run(self.__claim_pending, self.__shared)
+
+  async def __write_loop(self) -> None:
+    while True:
+      await self.__wakeup.wait()
+      if len(self.__appends) < self.__batch_size:
+        try:
+          async with asyncio.timeout(self.__commit_interval):
+            await self.__full.wait()
+        except TimeoutError:
+          pass
+      self.__wakeup.clear()
+      self.__full.clear()
+      await self.__commit()
+
+  async def __renew_loop(self) -> None:
+    while True:
+      await asyncio.sleep(self.__lease / 3)
+      try:
+        await self.__run(self.__renew)
+      except sqlite3.Error:
+        self.__logger.exception("Failed to renew spool leases")
+
+  async def __commit(self) -> None:
+    appends, self.__appends = self.__appends, []
+    settled, self.__settled = self.__settled, []
+    if not appends and not settled:
+      return
+
+    try:
+      ids = await self.__run(self.__write, [d for d, _ in appends], settled)
+    except Exception as e:
+      self.__logger.exception("Failed to write %d deliveries to the spool", len(appends))
+      for _, future in appends:
+        if not future.done():
+          future.set_exception(e)
+      return
+
+    for (_, future), spool_id in zip(appends, ids, strict=True):
+      if not future.done():
+        future.set_result(spool_id)
+
+  async def __run(self, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+  # executor thread
+
+  def __open(self) -> None:
+    self.__path.parent.mkdir(parents=True, exist_ok=True)
+    self.__db = sqlite3.connect(self.__path, isolation_level=None, check_same_thread=False)
+    self.__db.execute("PRAGMA journal_mode=WAL")
+    self.__db.execute("PRAGMA synchronous=FULL")
+    self.__db.execute(_SCHEMA)
+
+  def __write(self, appends: list[Delivery], settled: list[int]) -> list[int]:
+    ids = []
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN")
+      for delivery in appends:
+        cursor = self.__db.execute(
+          "INSERT INTO spool (hook_id, token, body, created, owner, leased_until) VALUES (?, ?, ?, ?, ?, ?)",
+          (delivery.hook_id, delivery.token, self.__codec.dumps(delivery.body), now, self.__owner, now + self.__lease),
+        )
+        ids.append(cursor.lastrowid)
+      if settled:
+        self.__db.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in settled])
+    return ids
+
+  def __renew(self) -> None:
+    self.__db.execute("UPDATE spool SET leased_until = ? WHERE owner = ?", (time.time() + self.__lease, self.__owner))
+
+  def __claim_pending(self, expired_only: bool) -> list[Delivery]:
+    now = time.time()
+    with self.__db:
+      self.__db.execute("BEGIN IMMEDIATE")
+      rows = self.__db.execute(
+        """
+        UPDATE spool SET owner = :owner, leased_until = :leased_until
+        WHERE owner IS NOT :owner AND (leased_until <= :now OR NOT :expired_only)
+        RETURNING id, hook_id, token, body
+        """,
+        {"owner": self.__owner, "leased_until": now + self.__lease, "now": now, "expired_only": expired_only},
+      ).fetchall()
+    rows.sort()
+    return [Delivery(hook_id, token, self.__codec.loads(body), (spool_id,)) for spool_id, hook_id, token, body in rows]
@@ -0,0 +1,212 @@
+"""
+Throttling of noisy events per repository, folding the excess into digests.
+
+Each event type given a rule has a token bucket per Discord webhook and
+repository, holding up to ``burst`` messages and refilling at ``burst`` per
+``window`` seconds. Messages that find the bucket empty aren't sent. They're
+counted instead, and ``window`` seconds after the first of them a single
+digest such as "37 new stars in the last 10 minutes" is sent in their place.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from logging import Logger
+from typing import Any, NamedTuple, Optional
+
+from .delivery import Delivery
+from .util import truncate
+from .webhook import DESCRIPTION_LENGTH, TITLE_LENGTH
+
+# what a digest calls the events it counts, for the events that are usually throttled
+_NOUNS = {
+  "star": ("new star", "new stars"),
+  "watch": ("new watcher", "new watchers"),
+  "fork": ("new fork", "new forks"),
+  "issue_comment": ("new comment", "new comments"),
+  "pull_request_review_comment": ("new review comment", "new review comments"),
+  "commit_comment": ("new commit comment", "new commit comments"),
+  "check_run": ("check run", "check runs"),
+}
+
+# senders named in a digest before the rest are just counted
+_MAX_NAMED_SENDERS = 5
+_DIGEST_COLOR = 0x6E7681
+
+
+class ThrottleRule(NamedTuple):
+  burst: int
+  window: float
+
+
+def parse_rules(raw: Optional[dict[str, Any]]) -> dict[str, ThrottleRule]:
+  """
+  Read rules from config, as a map of event names to ``{"burst": 3, "window": 600}``
+  """
+  rules = {}
+  for event, rule in (raw or {}).items():
+    try:
+      rules[event] = ThrottleRule(int(rule["burst"]), float(rule["window"]))
+    except (KeyError, TypeError, ValueError) as e:
+      raise ValueError(f"Throttle rule for '{event}' needs a numeric burst and window") from e
+    if rules[event].burst < 1 or rules[event].window <= 0:
+      raise ValueError(f"Throttle rule for '{event}' needs a burst of at least 1 and a positive window")
+  return rules
+
+
+def _duration(seconds: float) -> str:
+  for unit, length in (("hour", 3600), ("minute", 60)):
+    if seconds >= length:
+      count = round(seconds / length)
+      return f"{unit}" if count == 1 else f"{count} {unit}s"
+  count = round(seconds)
+  return "second" if count == 1 else f"{count} seconds"
+
+
+class _Bucket:
+  """
+  Tokens left for one webhook, repository and event, and what has been held back since the last digest
+  """
+
+  __slots__ = ("senders", "since", "suppressed", "timer", "tokens", "updated")
+
+  def __init__(self, tokens: float, now: float):
+    self.tokens = tokens
+    self.updated = now
+    self.suppressed = 0
+    self.since = now
+    self.senders: list[str] = []
+    self.timer: Optional[asyncio.TimerHandle] = None
+
+
+type _Key = tuple[str, str, str, str]
+
+
+class Throttle:
+  """
+  Rate limits events by rule, keeping at most ``max_keys`` buckets.
+
+  Buckets are kept in order of use. Once there are too many, the least recently used are dropped,
+  with any digest they are holding sent early. Buckets that have been left alone long enough to
+  refill are dropped as others are used, since they'd behave the same as a new one.
+  """
+
+  __buckets: OrderedDict[_Key, _Bucket]
+  __pending: set[asyncio.Task]
+
+  def __init__(
+    self,
+    rules: dict[str, ThrottleRule],
+    sink: Callable[[Delivery], Awaitable[None]],
+    logger: Logger,
+    max_keys: int,
+  ):
+    self.__rules = rules
+    self.__sink = sink
+    self.__logger = logger
+    self.__max_keys = max_keys
+    self.__buckets = OrderedDict()
+    self.__pending = set()
+
+  def covers(self, event: str) -> bool:
+    return event in self.__rules
+
+  def admit(self, hook_id: str, token: str, repository: Optional[str], event: str, body: Any) -> bool:
+    """
+    Whether a message may be sent now. If not, it's counted towards the next digest instead
+    """
+    rule = self.__rules.get(event)
+    if rule is None:
+      return True
+
+    now = time.monotonic()
+    key = (hook_id, token, repository or "", event)
+    bucket = self.__buckets.get(key)
+    if bucket is None:
+      self.__evict(now)
+      bucket = self.__buckets[key] = _Bucket(rule.burst, now)
+    else:
+      self.__buckets.move_to_end(key)
+      bucket.tokens = min(rule.burst, bucket.tokens + (now - bucket.updated) * rule.burst / rule.window)
+      bucket.updated = now
+
+    if bucket.tokens >= 1:
+      bucket.tokens -= 1
+      return True
+
+    bucket.suppressed += 1
+    if len(bucket.senders) <= _MAX_NAMED_SENDERS:
+      for embed in body.get("embeds") or ():
+        sender = (embed.get("author") or {}).get("name")
+        if sender and sender not in bucket.senders:
+          bucket.senders.append(sender)
+    if bucket.timer is None:
+      bucket.since = now
+      bucket.timer = asyncio.get_running_loop().call_later(rule.window, self.__flush, key)
+    return False
+
+  async def stop(self) -> None:
+    """
+    Send every pending digest immediately, and wait for them to be handed off
+    """
+    for key, bucket in list(self.__buckets.items()):
+      if bucket.timer is not None:
+        self.__flush(key)
+    self.__buckets.clear()
+    await asyncio.gather(*self.__pending, return_exceptions=True)
+
+  def __evict(self, now: float) -> None:
+    while self.__buckets:
+      key, bucket = next(iter(self.__buckets.items()))
+      refilled = now - bucket.updated >= self.__rules[key[3]].window
+      if len(self.__buckets) < self.__max_keys and not (refilled and bucket.timer is None):
+        return
+
+      if bucket.timer is not None:
+        self.__flush(key)
+      del self.__buckets[key]
+
+  def __flush(self, key: _Key) -> None:
+    bucket = self.__buckets.get(key)
+    if bucket is None or bucket.timer is None:
+      return
+
+    bucket.timer.cancel()
+    hook_id, token, repository, event = key
+    delivery = Delivery(hook_id, token, self.__digest(repository, event, bucket))
+    bucket.timer = None
+    bucket.suppressed = 0
+    bucket.senders = []
+
+    self.__logger.debug("Sending digest of %s events for %s to webhook %s", event, repository, hook_id)
+    task = asyncio.create_task(self.__sink(delivery))
+    self.__pending.add(task)
+    task.add_done_callback(self.__pending.discard)
+
+  def __digest(self, repository: str, event: str, bucket: _Bucket) -> dict:
+    singular, plural = _NOUNS.get(event, (f"{event} event", f"{event} events"))
+    noun = singular if bucket.suppressed == 1 else plural
+    # digests can be sent early, when their bucket is dropped
+    elapsed = _duration(max(1.0, time.monotonic() - bucket.since))
+    title = f"{bucket.suppressed} {noun} in the last {elapsed}"
+    if repository:
+      title = f"[{repository}] {title}"
+
+    senders = bucket.senders[:_MAX_NAMED_SENDERS]
+    description = None
+    if senders:
+      description = "From " + ", ".join(senders)
+      if len(bucket.senders) > len(senders):
+        description += " and others"
+
+    return {
+      "embeds": [
+        {
+          "title": truncate(title, TITLE_LENGTH),
+          "url": f"https://github.com/{repository}" if repository else None,
+          "description": truncate(description, DESCRIPTION_LENGTH) if description else None,
+          "color": _DIGEST_COLOR,
+        }
+      ]
+    }
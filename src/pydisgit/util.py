@@ -1,18 +1,86 @@
-import re
 from typing import Optional
 
-__NEWLINE_REGEXP = re.compile(r"<!--(?:.|\n|\r)*?-->[\n|\r]*")
+_COMMENT_START = "<!--"
+_COMMENT_END = "-->"
+_ASTRAL = "\uffff"
+
+
+def utf16_len(text: str) -> int:
+  """
+  Length of ``text`` as Discord counts it, in UTF-16 code units
+  """
+  if text.isascii() or max(text) <= _ASTRAL:
+    return len(text)
+  return len(text) + sum(1 for c in text if c > _ASTRAL)
+
+
+def _utf16_prefix(text: str, units: int) -> str:
+  """
+  The longest prefix of ``text`` that fits in ``units`` UTF-16 code units, without splitting a surrogate pair
+  """
+  if utf16_len(text) == len(text):
+    return text[:units]
+
+  end = 0
+  for c in text:
+    units -= 2 if c > _ASTRAL else 1
+    if units < 0:
+      break
+    end += 1
+  return text[:end]
 
 
 def truncate(text: str, num: int) -> Optional[str]:
+  """
+  Strip HTML comments from ``text`` and cut it to at most ``num`` UTF-16 code units, marking any cut with ``...``.
+
+  Only as much of ``text`` is looked at as it takes to fill ``num``, and ``text`` itself is returned when it
+  needs no changes.
+  """
   if not text:
     return None
-
-  text = __NEWLINE_REGEXP.sub("", text)
-  if len(text) <= num:
+  if len(text) <= num and _COMMENT_START not in text and utf16_len(text) <= num:
     return text
 
-  return text[0 : num - 3] + "..."
+  pieces = []
+  units = 0
+  pos = 0
+  length = len(text)
+  comments = True
+  while pos < length:
+    # every character is at least one code unit, so nothing past this can fit
+    window = pos + (num - units) + 1
+    start = text.find(_COMMENT_START, pos, window + len(_COMMENT_START)) if comments else -1
+    end = min(length if start < 0 else start, window)
+    chunk = text[pos:end]
+    pieces.append(chunk)
+    units += utf16_len(chunk)
+    if units > num:
+      return _utf16_prefix("".join(pieces), num - 3) + "..."
+    if start < 0 or start >= window:
+      # reached the end of the text without running out of room
+      break
+
+    close = text.find(_COMMENT_END, start + len(_COMMENT_START))
+    if close < 0:
+      # an unterminated comment is left as it is
+      comments = False
+      pos = start
+      continue
+
+    pos = close + len(_COMMENT_END)
+    while pos < length and text[pos] in "\r\n":
+      pos += 1
+
+  return pieces[0] if len(pieces) == 1 else "".join(pieces)
+
+
+def first_line(text: str) -> str:
+  """
+  Get the first line of ``text``, without looking any further into it
+  """
+  end = text.find("\n")
+  return text if end < 0 else text[:end]
 
 
 def short_commit(hash: str) -> str:
@@ -3,27 +3,50 @@ Core logic for webhook handling
 """
 
 import inspect
-from collections.abc import Callable
+import re
+from collections.abc import Callable, Iterator
 from dataclasses import dataclass, field
+from functools import cache
 from logging import Logger
+from time import perf_counter
 from typing import Any, NamedTuple, Optional
 
+import msgspec
+
 from .conf import BoundEnv
-from .util import truncate
+from .metrics import HANDLER_SECONDS, STAGE_SECONDS
+from .models import User
+from .util import truncate, utf16_len
 
+# Discord's limits on a single message
+MAX_EMBEDS = 10
+MAX_MESSAGE_LENGTH = 6000
+MAX_FIELDS = 25
 
-class Sender(NamedTuple):
-  """
-  GH API Sender representation
-  """
+# how much of each part of an embed we'll send, at or under Discord's own limits
+TITLE_LENGTH = 255
+AUTHOR_LENGTH = 255
+DESCRIPTION_LENGTH = 1000
+FOOTER_LENGTH = 255
+FIELD_NAME_LENGTH = 255
+FIELD_VALUE_LENGTH = 1000
 
-  login: str
-  html_url: str
-  avatar_url: str
+# fields that would have to be cut shorter than this are left out instead
+MIN_FIELD_VALUE_LENGTH = 32
 
-  @classmethod
-  def from_json(cls, data: Any):
-    return cls(data["login"], data["html_url"], data["avatar_url"])
+
+def embed_length(embed: dict) -> int:
+  """
+  Count the characters in a rendered embed that Discord counts towards ``MAX_MESSAGE_LENGTH``, in UTF-16 code units
+  """
+  total = utf16_len(embed.get("title") or "") + utf16_len(embed.get("description") or "")
+  if author := embed.get("author"):
+    total += utf16_len(author.get("name") or "")
+  if footer := embed.get("footer"):
+    total += utf16_len(footer.get("text") or "")
+  for f in embed.get("fields") or ():
+    total += utf16_len(f.get("name") or "") + utf16_len(f.get("value") or "")
+  return total
 
 
 class Field(NamedTuple):
@@ -35,13 +58,23 @@ class Field(NamedTuple):
   value: str
   inline: bool = True
 
-  def to_json(self) -> Any:
+  def to_json(self, max_length: int = MAX_MESSAGE_LENGTH) -> Optional[Any]:
     """
-    Return a JSON representation of this field for sending to discord
+    Return a JSON representation of this field for sending to discord, using at most ``max_length`` characters.
+
+    ``None`` is returned if the field is empty, or can't be given a useful amount of room.
     """
+    name = truncate(self.name, FIELD_NAME_LENGTH)
+    if not name or not self.value:
+      return None
+
+    room = min(FIELD_VALUE_LENGTH, max_length - utf16_len(name))
+    if room < min(utf16_len(self.value), MIN_FIELD_VALUE_LENGTH):
+      return None
+
     return {
-      "name": self.name,
-      "value": truncate(self.value, 1000),
+      "name": name,
+      "value": truncate(self.value, room),
       "inline": self.inline,
     }
 
@@ -54,41 +87,74 @@ class EmbedBody:
 
   title: str
   url: Optional[str]
-  sender: Sender
+  sender: User
   color: int
   description: Optional[str] = None
   footer: Optional[str] = None
   fields: list[Field] = field(default_factory=lambda: [])
 
   def __post_init__(self):
-    if not isinstance(self.sender, Sender):
-      self.sender = Sender.from_json(self.sender)
+    if not isinstance(self.sender, User):
+      self.sender = msgspec.convert(self.sender, User)
 
   def to_json(self) -> Any:
+    """
+    Render this embed as a message Discord will accept.
+
+    The whole message is kept within ``MAX_MESSAGE_LENGTH``, with the title, author, description and footer
+    given room first, in that order. Fields share whatever is left, in order, and any past ``MAX_FIELDS`` or
+    that no longer fit are dropped.
+    """
+    budget = MAX_MESSAGE_LENGTH
+
+    def fit(text: Optional[str], limit: int) -> Optional[str]:
+      nonlocal budget
+      # leave room for at least one character and the ellipsis
+      if not text or budget < 4:
+        return None
+      text = truncate(text, min(limit, budget))
+      budget -= utf16_len(text)
+      return text
+
+    title = fit(self.title, TITLE_LENGTH)
+    author = fit(self.sender.login, AUTHOR_LENGTH)
+    description = fit(self.description, DESCRIPTION_LENGTH)
+    footer = fit(self.footer, FOOTER_LENGTH)
+
+    fields = []
+    for f in self.fields:
+      if len(fields) == MAX_FIELDS:
+        break
+      rendered = f.to_json(budget)
+      if rendered is not None:
+        fields.append(rendered)
+        budget -= utf16_len(rendered["name"]) + utf16_len(rendered["value"])
+
     return {
       "embeds": [
         {
-          "title": truncate(self.title, 255),
+          "title": title,
           "url": self.url,
-          "description": truncate(self.description, 1000) if self.description else None,
+          "description": description,
           "author": {
-            "name": truncate(self.sender.login, 255),
+            "name": author,
             "url": self.sender.html_url,
             "icon_url": self.sender.avatar_url,
           },
           "color": self.color,
           "footer": {
-            "text": truncate(self.footer, 255),
+            "text": footer,
           }
-          if self.footer
+          if footer
           else None,
-          "fields": [f.to_json() for f in self.fields],
+          "fields": fields,
         }
       ]
     }
 
 
-type EventHandler = Callable[[BoundEnv, dict], Optional[EmbedBody]]
+# handlers receive the raw JSON body of a webhook
+type EventHandler = Callable[[BoundEnv, bytes], Optional[EmbedBody]]
 
 
 class BoundRouter:
@@ -97,14 +163,58 @@ class BoundRouter:
     self._env = env
     self._logger = logger
 
-  def process_request(self, gh_hook_type: str, gh_data: dict) -> Optional[Any]:
+  def accepts(self, gh_hook_type: str) -> bool:
+    """
+    Whether an event type could produce a message, judging from its name alone.
+
+    This is checked before the body is read, so ignored and unhandled events cost nothing to turn away.
+    """
+    if self._env.ignored_payload(gh_hook_type):
+      self._logger.info("Ignoring payload type %s", gh_hook_type)
+      return False
+
+    if gh_hook_type not in self._handlers:
+      self._logger.debug("No handler for %s", gh_hook_type)
+      return False
+
+    return True
+
+  def action(self, gh_hook_type: str, gh_data: bytes) -> Optional[str]:
+    """
+    The action of a payload, if its event is dispatched by action
+    """
+    if isinstance(self._handlers.get(gh_hook_type), _ActionDispatcher):
+      return payload_action(gh_data)
+    return None
+
+  def accepts_action(self, gh_hook_type: str, action: Optional[str]) -> bool:
+    """
+    Whether an action has a handler, for events dispatched by action
+    """
+    handler = self._handlers.get(gh_hook_type)
+    if not isinstance(handler, _ActionDispatcher):
+      return handler is not None
+
+    if action not in handler.dispatchers:
+      self._logger.debug("No handler for action %s of %s", action, gh_hook_type)
+      return False
+
+    return True
+
+  def process_request(self, gh_hook_type: str, gh_data: bytes) -> Optional[Any]:
     """
-    Process the request based on the hook types
+    Process the request based on the hook types, decoding the JSON payload ``gh_data``
     """
     if self._env.ignored_payload(gh_hook_type):
       self._logger.info("Ignoring payload type %s", gh_hook_type)
       return None
 
+    if self._env.has_scoped_ignores:
+      repository = payload_repository(gh_data)
+      if repository is not None and self._env.ignored_payload(gh_hook_type, repository):
+        self._logger.info("Ignoring payload type %s for %s", gh_hook_type, repository)
+        return None
+
     if gh_hook_type not in self._handlers:
       self._logger.debug("No handler for %s", gh_hook_type)
       return None
@@ -114,7 +224,164 @@ class BoundRouter:
       self._logger.debug("Produced no result for event type '%s' with payload '%s", gh_hook_type, gh_data)
       return None
 
-    return result.to_json()
+    start = perf_counter()
+    body = result.to_json()
+    STAGE_SECONDS.since(start, "to_json")
+    return body
+
+
+class PayloadError(ValueError):
+  """
+  Raised when a payload does not contain the keys a handler requires
+  """
+
+
+class _Action(msgspec.Struct, gc=False):
+  action: Optional[str] = None
+
+
+class _RepositoryName(msgspec.Struct, gc=False):
+  full_name: str
+
+
+class _Repository(msgspec.Struct, gc=False):
+  repository: Optional[_RepositoryName] = None
+
+
+_action_decoder = msgspec.json.Decoder(_Action)
+# GitHub serialises the action first, so it can usually be read without scanning the rest of the body
+_leading_action = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([A-Za-z0-9_]*)"')
+_repository_decoder = msgspec.json.Decoder(_Repository)
+
+
+class _CallPlan:
+  """
+  A handler compiled into a decoder for exactly the arguments it takes.
+
+  Parameters are decoded as their annotated types (see ``models``), or as
+  plain JSON values when they have no annotation. Any part of the payload
+  the handler doesn't ask for is skipped without being materialised.
+  """
+
+  __slots__ = ("__name__", "decoder", "func", "inject_env", "names")
+
+  def __init__(self, func: Callable):
+    self.func = func
+    self.__name__ = func.__name__
+
+    fields = []
+    pass_all = False
+    self.inject_env = False
+    for name, param in inspect.signature(func, eval_str=True).parameters.items():
+      annotation = Any if param.annotation is inspect.Parameter.empty else param.annotation
+      match param.kind:
+        case inspect.Parameter.VAR_KEYWORD:
+          pass_all = True
+        case inspect.Parameter.POSITIONAL_ONLY | inspect.Parameter.VAR_POSITIONAL:
+          raise ValueError(f"Handler {func.__qualname__} has parameter '{name}' that cannot be passed by keyword")
+        case _ if name == "env" and annotation == BoundEnv:
+          # if there's an env parameter, inject our environment state
+          self.inject_env = True
+        case _ if name == "env":
+          raise ValueError(f"Handler {func.__qualname__} must annotate 'env' as BoundEnv to have it injected")
+        case _ if param.default is inspect.Parameter.empty:
+          fields.append((name, annotation))
+        case _:
+          fields.append((name, annotation, param.default))
+
+    self.names = None if pass_all else tuple(f[0] for f in fields)
+    try:
+      if pass_all:
+        self.decoder = msgspec.json.Decoder(dict[str, Any])
+      else:
+        self.decoder = msgspec.json.Decoder(msgspec.defstruct(f"{func.__name__}_payload", fields, gc=False))
+    except TypeError as e:
+      raise ValueError(f"Handler {func.__qualname__} has parameters that cannot be decoded: {e}") from e
+
+  def __call__(self, env: BoundEnv, data: bytes) -> Optional[EmbedBody]:
+    start = perf_counter()
+    try:
+      payload = self.decoder.decode(data)
+    except msgspec.ValidationError as e:
+      raise PayloadError(f"Payload does not match handler {self.__name__}: {e}") from e
+    except msgspec.DecodeError as e:
+      raise PayloadError(f"Payload is not valid JSON: {e}") from e
+
+    if self.names is None:
+      args = payload
+    else:
+      args = {k: getattr(payload, k) for k in self.names}
+
+    if self.inject_env:
+      args["env"] = env
+
+    # then call the actual handler
+    result = self.func(**args)
+    HANDLER_SECONDS.since(start, self.__name__)
+    return result
+
+
+class _ActionDispatcher:
+  """
+  Handlers for one event, chosen by the action of each payload
+  """
+
+  __slots__ = ("dispatchers",)
+
+  def __init__(self):
+    self.dispatchers: dict[str, EventHandler] = {}
+
+  def __call__(self, env: BoundEnv, data: bytes) -> Optional[EmbedBody]:
+    handler = self.dispatchers.get(payload_action(data))
+    if handler is None:
+      return None
+    return handler(env, data)
+
+
+@cache
+def _item_decoder(item_type: type) -> msgspec.json.Decoder:
+  return msgspec.json.Decoder(item_type)
+
+
+def decode_each[T](items: list[msgspec.Raw], item_type: type[T]) -> Iterator[T]:
+  """
+  Decode a list of raw JSON values one at a time, for handlers that may not need all of them
+  """
+  decoder = _item_decoder(item_type)
+  for item in items:
+    try:
+      yield decoder.decode(item)
+    except msgspec.ValidationError as e:
+      raise PayloadError(f"Payload has an invalid {item_type.__name__}: {e}") from e
+
+
+def payload_action(data: bytes) -> Optional[str]:
+  """
+  Read only the action of a payload
+  """
+  match = _leading_action.match(data)
+  if match is not None:
+    return match.group(1).decode()
+
+  try:
+    return _action_decoder.decode(data).action
+  except msgspec.ValidationError as e:
+    raise PayloadError(f"Payload has an invalid action: {e}") from e
+  except msgspec.DecodeError as e:
+    raise PayloadError(f"Payload is not valid JSON: {e}") from e
+
+
+def payload_repository(data: bytes) -> Optional[str]:
+  """
+  Read only the full name of the repository a payload is for, if any
+  """
+  try:
+    repository = _repository_decoder.decode(data).repository
+  except msgspec.ValidationError as e:
+    raise PayloadError(f"Payload has an invalid repository: {e}") from e
+  except msgspec.DecodeError as e:
+    raise PayloadError(f"Payload is not valid JSON: {e}") from e
+  return repository.full_name if repository else None
 
 
 class WebhookRouter:
@@ -126,25 +393,8 @@ class WebhookRouter:
   def bind(self, env: BoundEnv, logger: Logger) -> BoundRouter:
     return BoundRouter(self.__handlers, env, logger)
 
-  def _wrap_func(self, func):
-    def result(env, data):
-      sig = inspect.signature(func)
-      final_data = dict(data)
-      # if we don't have a kwargs field, remove any extra attributes from the args map
-      if len([v for v in sig.parameters.values() if v.kind == inspect.Parameter.VAR_KEYWORD]) == 0:
-        for k in data.keys():
-          if k not in sig.parameters.keys():
-            del final_data[k]
-
-      # if there's an env parameter, inject our environment state
-      env_param = sig.parameters.get("env", None)
-      if env_param and env_param.annotation == BoundEnv:
-        final_data["env"] = env
-
-      # then call the actual handler
-      return func(**final_data)
-
-    return result
+  def _wrap_func(self, func) -> EventHandler:
+    return _CallPlan(func)
 
   def handler(self, event: str) -> Callable:
     """
@@ -153,7 +403,7 @@ class WebhookRouter:
 
     def decorator(func):
       if event in self.__handlers:
-        raise f"Already registered a handler for {event}!"
+        raise ValueError(f"Already registered a handler for {event}!")
 
       self.__handlers[event] = self._wrap_func(func)
       return func
@@ -166,24 +416,19 @@ class WebhookRouter:
     for ``event`` based on the provided action.
     """
 
-    dispatchers: dict[str, EventHandler] = {}
-
-    def subhandler(env, data) -> Optional[EmbedBody]:
-      action = data.get("action", None)
-      if action not in dispatchers:
-        return None
-      return dispatchers[action](env, data)
+    dispatcher = _ActionDispatcher()
+    dispatchers = dispatcher.dispatchers
 
     def decorator_wrap(action: str) -> Callable[[EventHandler], EventHandler]:
       def decorator(func: EventHandler) -> EventHandler:
         if action in dispatchers:
-          raise f"Already registered a subhandler for {action} (in {event}!"
+          raise ValueError(f"Already registered a subhandler for {action} (in {event})!")
 
         dispatchers[action] = self._wrap_func(func)
         return func
 
       return decorator
 
-    self.__handlers[event] = subhandler
+    self.__handlers[event] = dispatcher
 
     return decorator_wrap
@@ -0,0 +1,98 @@
+"""
+Shared fixtures, including a stub of Discord's webhook API
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any, Optional
+
+import httpx
+import pytest
+
+from pydisgit import server
+from pydisgit.codec import select_codec
+from pydisgit.discord import DiscordClient
+from pydisgit.ratelimit import RateLimitScheduler
+
+SECRET = "test-secret"
+SENDER = {"login": "kashike", "html_url": "https://github.com/kashike", "avatar_url": "https://github.com/kashike.png"}
+REPOSITORY = {
+  "name": "adventure",
+  "full_name": "KyoriPowered/adventure",
+  "html_url": "https://github.com/KyoriPowered/adventure",
+}
+STAR = {"action": "created", "repository": REPOSITORY, "sender": SENDER}
+
+logger = logging.getLogger("pydisgit.tests")
+codec = select_codec("json")
+
+type Responder = Callable[[httpx.Request], httpx.Response | Awaitable[httpx.Response]]
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+  return "asyncio"
+
+
+class StubDiscord:
+  """
+  Answers webhook requests with the given responses in turn, then with 204s, recording every request
+  """
+
+  def __init__(self, *responses: httpx.Response | Responder):
+    self.responses = list(responses)
+    self.requests: list[httpx.Request] = []
+
+  async def __call__(self, request: httpx.Request) -> httpx.Response:
+    self.requests.append(request)
+    response = self.responses.pop(0) if self.responses else httpx.Response(204)
+    if callable(response):
+      response = response(request)
+      if isinstance(response, Awaitable):
+        response = await response
+    return response
+
+  @property
+  def paths(self) -> list[str]:
+    return [r.url.path for r in self.requests]
+
+  def http_client(self) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(self))
+
+  def client(self, max_retries: int = 3) -> DiscordClient:
+    scheduler = RateLimitScheduler(logger, max_retries, max_backoff=0.01)
+    return DiscordClient(self.http_client(), scheduler, codec, "https://discord.test/api")
+
+
+@pytest.fixture
+def make_app(monkeypatch) -> Callable[..., Any]:
+  """
+  Build the app from the given config, talking to a stub Discord rather than the real one
+  """
+
+  def make(stub: StubDiscord, **config: Any):
+    config = {"HTTP_WARMUP": False, "GITHUB_WEBHOOK_SECRET": SECRET, "DISCORD_MAX_RETRIES": 0, **config}
+    for key, value in config.items():
+      monkeypatch.setenv(f"PYDISGIT_{key}", value if isinstance(value, str) else json.dumps(value))
+    monkeypatch.setattr(server, "create_http_client", lambda app: stub.http_client())
+    return server.create_app()
+
+  return make
+
+
+async def post_webhook(
+  client, path: str, event: str, payload: dict, delivery: Optional[str] = None, secret: Optional[str] = SECRET
+):
+  """
+  Send a webhook the way GitHub does, signed with ``secret``
+  """
+  body = json.dumps(payload).encode()
+  headers = {"X-GitHub-Event": event, "Content-Type": "application/json"}
+  if delivery is not None:
+    headers["X-GitHub-Delivery"] = delivery
+  if secret is not None:
+    headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+  return await client.post(path, data=body, headers=headers)
@@ -0,0 +1,151 @@
+"""
+Answering GitHub redeliveries from the delivery cache
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from conftest import STAR, StubDiscord, codec, logger, post_webhook
+
+from pydisgit import dedup
+from pydisgit.dedup import CachedResponse, DeliveryCache, SqliteDeliveryCache
+
+pytestmark = pytest.mark.anyio
+
+RESPONSE = CachedResponse("delivered", 200, "application/json", b"{}")
+
+
+async def test_cache_answers_until_expiry():
+  cache = DeliveryCache(max_entries=10, ttl=0.1)
+  await cache.put("a", RESPONSE)
+
+  assert await cache.get("a") == RESPONSE
+  assert await cache.get("b") is None
+  await asyncio.sleep(0.15)
+  assert await cache.get("a") is None
+
+
+async def test_cache_drops_least_recently_used():
+  cache = DeliveryCache(max_entries=2, ttl=60)
+  await cache.put("a", RESPONSE)
+  await cache.put("b", RESPONSE)
+  await cache.get("a")
+  await cache.put("c", RESPONSE)
+
+  assert [await cache.get(k) is not None for k in "abc"] == [True, False, True]
+
+
+async def test_sqlite_cache_is_kept_across_restarts(tmp_path):
+  cache = SqliteDeliveryCache(tmp_path / "deliveries.sqlite3", logger, max_entries=10, ttl=60)
+  await cache.open()
+  await cache.put("a", RESPONSE)
+  await cache.close()
+
+  cache = SqliteDeliveryCache(tmp_path / "deliveries.sqlite3", logger, max_entries=10, ttl=60)
+  await cache.open()
+  try:
+    assert await cache.get("a") == RESPONSE
+  finally:
+    await cache.close()
+
+
+async def test_sqlite_cache_prunes_expired_and_excess_entries(tmp_path, monkeypatch):
+  monkeypatch.setattr(dedup, "_PRUNE_INTERVAL", 1)
+  cache = SqliteDeliveryCache(tmp_path / "deliveries.sqlite3", logger, max_entries=2, ttl=60)
+  await cache.open()
+  try:
+    for key in "abc":
+      await cache.put(key, RESPONSE)
+      # entries are dropped in order of expiry, which needs them to differ
+      await asyncio.sleep(0.01)
+
+    assert [await cache.get(k) is not None for k in "abc"] == [False, True, True]
+
+    monkeypatch.setattr(time, "time", lambda: 1e12)
+    await cache.put("d", RESPONSE)
+  finally:
+    await cache.close()
+
+  import sqlite3
+
+  with sqlite3.connect(tmp_path / "deliveries.sqlite3") as db:
+    assert [key for (key,) in db.execute("SELECT key FROM deliveries")] == ["d"]
+
+
+async def test_redelivery_is_answered_from_cache(make_app):
+  stub = StubDiscord()
+  app = make_app(stub)
+
+  async with app.test_app() as test_app:
+    client = test_app.test_client()
+    first = await post_webhook(client, "/1/a", "star", STAR, delivery="d1")
+    again = await post_webhook(client, "/1/a", "star", STAR, delivery="d1")
+    other = await post_webhook(client, "/1/a", "star", STAR, delivery="d2")
+
+  assert first.status_code == again.status_code == other.status_code == 200
+  assert await again.get_data() == await first.get_data()
+  assert stub.paths == ["/api/webhooks/1/a", "/api/webhooks/1/a"]
+
+
+async def test_concurrent_redelivery_waits_for_the_original(make_app):
+  release = asyncio.Event()
+
+  async def slow(request: httpx.Request) -> httpx.Response:
+    await release.wait()
+    return httpx.Response(204)
+
+  stub = StubDiscord(slow)
+  app = make_app(stub)
+
+  async with app.test_app() as test_app:
+    client = test_app.test_client()
+    first = asyncio.create_task(post_webhook(client, "/1/a", "star", STAR, delivery="d1"))
+    again = asyncio.create_task(post_webhook(client, "/1/a", "star", STAR, delivery="d1"))
+    await asyncio.sleep(0.05)
+    release.set()
+    first, again = await first, await again
+
+  assert first.status_code == again.status_code == 200
+  assert len(stub.requests) == 1
+
+
+async def test_route_redelivery_only_retries_failed_destinations(make_app, tmp_path):
+  routes = tmp_path / "routes.toml"
+  routes.write_text(
+    """
+    [routes.adventure]
+    destinations = [
+      { name = "main", hook_id = "1", token = "a" },
+      { name = "dev", hook_id = "2", token = "b" },
+    ]
+    """
+  )
+  failures = {"/api/webhooks/2/b": 1}
+
+  def responder(request: httpx.Request) -> httpx.Response:
+    if failures.get(request.url.path, 0) > 0:
+      failures[request.url.path] -= 1
+      return httpx.Response(400, json={"message": "Unknown Webhook"})
+    return httpx.Response(204)
+
+  stub = StubDiscord(*[responder] * 10)
+  app = make_app(stub, ROUTES_FILE=str(routes))
+
+  async with app.test_app() as test_app:
+    client = test_app.test_client()
+    first = await post_webhook(client, "/route/adventure", "star", STAR, delivery="d1")
+    second = await post_webhook(client, "/route/adventure", "star", STAR, delivery="d1")
+    third = await post_webhook(client, "/route/adventure", "star", STAR, delivery="d1")
+
+  outcomes = [
+    {r["destination"]: r["outcome"] for r in codec.loads(await response.get_data())["results"]}
+    for response in (first, second, third)
+  ]
+  assert (first.status_code, second.status_code, third.status_code) == (502, 200, 200)
+  assert outcomes[0] == {"main": "delivered", "dev": "failed"}
+  assert outcomes[1] == {"main": "duplicate", "dev": "delivered"}
+  # once every destination has been sent to, the whole response is remembered
+  assert outcomes[2] == outcomes[1]
+  assert stub.paths == ["/api/webhooks/1/a", "/api/webhooks/2/b", "/api/webhooks/2/b"]
@@ -0,0 +1,125 @@
+"""
+Delivery to a stub Discord, through the queue, rate limit scheduler and spool
+"""
+
+import time
+
+import httpx
+import pytest
+from conftest import StubDiscord, codec, logger
+
+from pydisgit.delivery import Delivery, DeliveryQueue
+from pydisgit.discord import DiscordClient
+from pydisgit.spool import Spool
+
+pytestmark = pytest.mark.anyio
+
+
+async def open_spool(directory) -> Spool:
+  spool = Spool(directory, codec, logger, commit_interval=0.01, batch_size=10)
+  await spool.open()
+  return spool
+
+
+async def left_in_spool(directory) -> list[Delivery]:
+  spool = await open_spool(directory)
+  try:
+    return await spool.pending()
+  finally:
+    await spool.close()
+
+
+async def deliver_all(discord: DiscordClient, spool: Spool, *bodies: dict, workers: int = 1) -> None:
+  queue = DeliveryQueue(discord, spool, logger, max_size=10, workers=workers)
+  await queue.start()
+  for body in bodies:
+    delivery = Delivery("1", "token", body)
+    spool_id = await spool.append(delivery)
+    assert queue.submit(delivery._replace(spool_ids=(spool_id,)))
+  await queue.stop()
+  await spool.close()
+
+
+async def test_rate_limited_message_is_sent_after_retry_after(tmp_path):
+  stub = StubDiscord(
+    httpx.Response(429, json={"message": "You are being rate limited.", "retry_after": 0.2, "global": False}),
+  )
+  spool = await open_spool(tmp_path)
+
+  start = time.monotonic()
+  await deliver_all(stub.client(), spool, {"content": "hello"})
+
+  assert len(stub.requests) == 2
+  assert time.monotonic() - start >= 0.2
+  assert codec.loads(stub.requests[1].content) == {"content": "hello"}
+  assert await left_in_spool(tmp_path) == []
+
+
+async def test_server_errors_are_retried(tmp_path):
+  stub = StubDiscord(httpx.Response(502), httpx.Response(503))
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(), spool, {"content": "hello"})
+
+  assert len(stub.requests) == 3
+  assert await left_in_spool(tmp_path) == []
+
+
+async def test_rejected_message_is_settled(tmp_path):
+  stub = StubDiscord(httpx.Response(400, json={"message": "Cannot send an empty message"}))
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(), spool, {"content": ""})
+
+  assert len(stub.requests) == 1
+  assert await left_in_spool(tmp_path) == []
+
+
+async def test_message_stays_spooled_when_retries_run_out(tmp_path):
+  stub = StubDiscord(*[httpx.Response(503)] * 3)
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(max_retries=2), spool, {"content": "hello"})
+
+  assert len(stub.requests) == 3
+  assert [d.body for d in await left_in_spool(tmp_path)] == [{"content": "hello"}]
+
+
+async def test_worker_survives_send_that_raises(tmp_path):
+  def broken(request: httpx.Request) -> httpx.Response:
+    raise RuntimeError("stub failure")
+
+  stub = StubDiscord(broken)
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(), spool, {"content": "first"}, {"content": "second"}, workers=1)
+
+  assert [codec.loads(r.content) for r in stub.requests] == [{"content": "first"}, {"content": "second"}]
+  assert [d.body for d in await left_in_spool(tmp_path)] == [{"content": "first"}]
+
+
+async def test_connection_failures_are_retried(tmp_path):
+  def refused(request: httpx.Request) -> httpx.Response:
+    raise httpx.ConnectError("Connection refused", request=request)
+
+  stub = StubDiscord(refused, refused)
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(), spool, {"content": "hello"})
+
+  assert len(stub.requests) == 3
+  assert await left_in_spool(tmp_path) == []
+
+
+async def test_timed_out_message_is_not_sent_twice(tmp_path):
+  def timed_out(request: httpx.Request) -> httpx.Response:
+    raise httpx.ReadTimeout("Timed out waiting for Discord", request=request)
+
+  stub = StubDiscord(timed_out)
+  spool = await open_spool(tmp_path)
+
+  await deliver_all(stub.client(), spool, {"content": "hello"})
+
+  # Discord may have posted it, so it's left for replay rather than retried straight away
+  assert len(stub.requests) == 1
+  assert [d.body for d in await left_in_spool(tmp_path)] == [{"content": "hello"}]
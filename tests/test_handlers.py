@@ -0,0 +1,74 @@
+"""
+Rendering of webhook payloads into Discord messages
+"""
+
+import json
+import logging
+
+import pytest
+from conftest import REPOSITORY, SENDER
+
+from pydisgit.conf import BoundEnv, Config
+from pydisgit.handlers import router
+from pydisgit.util import truncate, utf16_len
+from pydisgit.webhook import DESCRIPTION_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def handlers():
+  env = BoundEnv({k: getattr(Config, k) for k in dir(Config) if k.isupper()}, logger)
+  return router.bind(env, logger)
+
+
+def push_payload(messages: list[str]) -> bytes:
+  commits = [
+    {
+      "id": f"{i:040x}",
+      "url": f"https://github.com/KyoriPowered/adventure/commit/{i:040x}",
+      "message": message,
+      "author": {"name": "kashike", "username": "kashike"},
+    }
+    for i, message in enumerate(messages)
+  ]
+  return json.dumps(
+    {
+      "ref": "refs/heads/main/4.x",
+      "after": f"{len(messages):040x}",
+      "forced": False,
+      "compare": "https://github.com/KyoriPowered/adventure/compare/a...b",
+      "commits": commits,
+      "repository": REPOSITORY,
+      "sender": SENDER,
+    }
+  ).encode()
+
+
+def test_truncate_counts_utf16_code_units():
+  assert truncate("abc", 3) == "abc"
+  assert truncate("abcdef", 5) == "ab..."
+  assert utf16_len("\U0001f600") == 2
+  # a surrogate pair is never split
+  assert truncate("\U0001f600" * 4, 5) == "\U0001f600..."
+  assert truncate("a<!-- hidden -->b", 10) == "ab"
+
+
+def test_push_lists_commits_that_fit(handlers):
+  embed = handlers.process_request("push", push_payload(["fix: one", "feat: two"]))
+
+  description = embed["embeds"][0]["description"]
+  assert embed["embeds"][0]["title"] == "[adventure:main/4.x] 2 new commits"
+  assert description.splitlines()[1].endswith("feat: two - kashike")
+
+
+def test_push_with_emoji_keeps_count_of_commits_left_out(handlers):
+  # each emoji is two UTF-16 code units, but one character
+  messages = ["\U0001f389" * 40 for _ in range(60)]
+
+  description = handlers.process_request("push", push_payload(messages))["embeds"][0]["description"]
+
+  assert utf16_len(description) <= DESCRIPTION_LENGTH
+  last = description.splitlines()[-1]
+  listed = len(description.splitlines()) - 1
+  assert last == f"and {60 - listed} more commits"
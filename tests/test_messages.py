@@ -0,0 +1,98 @@
+"""
+Editing the message for a pull request as it changes
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from conftest import REPOSITORY, SENDER, StubDiscord, codec, logger, post_webhook
+
+from pydisgit.messages import MessageStore
+from pydisgit.spool import Spool
+
+pytestmark = pytest.mark.anyio
+
+
+def pull_request(action: str, number: int = 1142) -> dict:
+  return {
+    "action": action,
+    "number": number,
+    "pull_request": {
+      "number": number,
+      "title": "feat(api): book refactor",
+      "html_url": f"https://github.com/KyoriPowered/adventure/pull/{number}",
+    },
+    "repository": REPOSITORY,
+    "sender": SENDER,
+  }
+
+
+def message(request: httpx.Request) -> httpx.Response:
+  return httpx.Response(200, json={"id": "m1"})
+
+
+async def test_store_forgets_messages_after_ttl():
+  store = MessageStore(":memory:", logger, max_entries=10, ttl=0.1)
+  await store.open()
+  try:
+    await store.put("1/KyoriPowered/adventure#1142", "m1")
+    assert await store.get("1/KyoriPowered/adventure#1142") == "m1"
+    await asyncio.sleep(0.15)
+    assert await store.get("1/KyoriPowered/adventure#1142") is None
+  finally:
+    await store.close()
+
+
+async def test_later_changes_edit_the_message(make_app):
+  stub = StubDiscord(message, message)
+  app = make_app(stub, EDIT_IN_PLACE=True)
+
+  async with app.test_app() as test_app:
+    client = test_app.test_client()
+    for action in ("opened", "closed"):
+      response = await post_webhook(client, "/1/a", "pull_request", pull_request(action))
+      assert response.status_code == 200
+
+  assert [(r.method, r.url.path, r.url.query) for r in stub.requests] == [
+    ("POST", "/api/webhooks/1/a", b"wait=true"),
+    ("PATCH", "/api/webhooks/1/a/messages/m1", b""),
+  ]
+  assert codec.loads(stub.requests[1].content)["embeds"][0]["title"].startswith(
+    "[KyoriPowered/adventure] Pull request closed"
+  )
+
+
+async def test_changes_arriving_together_send_one_message(make_app):
+  async def slow_message(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(0.05)
+    return message(request)
+
+  stub = StubDiscord(slow_message, slow_message)
+  app = make_app(stub, EDIT_IN_PLACE=True)
+
+  async with app.test_app() as test_app:
+    client = test_app.test_client()
+    responses = await asyncio.gather(
+      post_webhook(client, "/1/a", "pull_request", pull_request("opened")),
+      post_webhook(client, "/1/a", "pull_request", pull_request("converted_to_draft")),
+    )
+
+  assert [r.status_code for r in responses] == [200, 200]
+  assert [r.method for r in stub.requests] == ["POST", "PATCH"]
+
+
+async def test_failed_message_is_not_spooled(make_app, tmp_path):
+  stub = StubDiscord(httpx.Response(500))
+  app = make_app(stub, EDIT_IN_PLACE=True, SPOOL_DIR=str(tmp_path))
+
+  async with app.test_app() as test_app:
+    response = await post_webhook(test_app.test_client(), "/1/a", "pull_request", pull_request("opened"))
+
+  assert response.status_code == 500
+  spool = Spool(tmp_path, codec, logger, commit_interval=0.01, batch_size=10)
+  await spool.open()
+  try:
+    assert await spool.pending() == []
+  finally:
+    await spool.close()
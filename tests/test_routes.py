@@ -0,0 +1,53 @@
+"""
+Routes that send one webhook to several Discord webhooks
+"""
+
+import pytest
+from conftest import STAR, StubDiscord, codec, post_webhook
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def routes(tmp_path):
+  path = tmp_path / "routes.toml"
+  path.write_text(
+    """
+    [routes.adventure]
+    destinations = [
+      { name = "main", hook_id = "1", token = "a" },
+      { name = "stars", hook_id = "2", token = "b", events = "star:created" },
+      { name = "pushes", hook_id = "3", token = "c", events = ["push"] },
+    ]
+    """
+  )
+  return str(path)
+
+
+async def test_route_sends_to_matching_destinations(make_app, routes):
+  stub = StubDiscord()
+  app = make_app(stub, ROUTES_FILE=routes)
+
+  async with app.test_app() as test_app:
+    response = await post_webhook(test_app.test_client(), "/route/adventure", "star", STAR)
+
+  assert response.status_code == 200
+  results = codec.loads(await response.get_data())["results"]
+  assert {r["destination"]: r["outcome"] for r in results} == {"main": "delivered", "stars": "delivered"}
+  assert sorted(stub.paths) == ["/api/webhooks/1/a", "/api/webhooks/2/b"]
+
+
+async def test_unsigned_webhooks_are_refused(make_app, routes):
+  stub = StubDiscord()
+  app = make_app(stub, ROUTES_FILE=routes)
+
+  async with app.test_app() as test_app:
+    response = await post_webhook(test_app.test_client(), "/route/adventure", "star", STAR, secret=None)
+
+  assert response.status_code == 403
+  assert stub.requests == []
+
+
+def test_routes_need_a_webhook_secret(make_app, routes):
+  with pytest.raises(ValueError, match="GITHUB_WEBHOOK_SECRET"):
+    make_app(StubDiscord(), ROUTES_FILE=routes, GITHUB_WEBHOOK_SECRET="")
@@ -0,0 +1,79 @@
+"""
+Spooled messages, and leasing them between worker processes
+"""
+
+import asyncio
+
+import pytest
+from conftest import codec, logger
+
+from pydisgit.delivery import Delivery
+from pydisgit.spool import Spool
+
+pytestmark = pytest.mark.anyio
+
+MESSAGE = Delivery("1", "a", {"content": "hello"})
+
+
+async def open_spool(directory, shared: bool = True, lease: float = 0.3) -> Spool:
+  spool = Spool(directory, codec, logger, commit_interval=0.01, batch_size=10, shared=shared, lease=lease)
+  await spool.open()
+  return spool
+
+
+async def test_settled_messages_are_not_replayed(tmp_path):
+  spool = await open_spool(tmp_path, shared=False)
+  sent = await spool.append(MESSAGE)
+  await spool.append(MESSAGE._replace(body={"content": "unsent"}))
+  spool.settle((sent,))
+  await spool.close()
+
+  spool = await open_spool(tmp_path, shared=False)
+  try:
+    assert [d.body for d in await spool.pending()] == [{"content": "unsent"}]
+  finally:
+    await spool.close()
+
+
+async def test_live_workers_keep_their_messages(tmp_path):
+  first = await open_spool(tmp_path)
+  second = await open_spool(tmp_path)
+  try:
+    await first.append(MESSAGE)
+    # well past the lease, which the first worker keeps renewing
+    await asyncio.sleep(0.6)
+    assert await second.pending() == []
+  finally:
+    await first.close()
+    await second.close()
+
+
+async def test_expired_leases_are_taken_over_once(tmp_path):
+  first = await open_spool(tmp_path)
+  await first.append(MESSAGE)
+  await first.close()
+
+  second = await open_spool(tmp_path)
+  third = await open_spool(tmp_path)
+  try:
+    assert await second.pending() == []
+    await asyncio.sleep(0.4)
+
+    claimed = await second.pending()
+    assert [(d.hook_id, d.body) for d in claimed] == [("1", {"content": "hello"})]
+    assert await third.pending() == []
+  finally:
+    await second.close()
+    await third.close()
+
+
+async def test_unshared_spool_replays_everything(tmp_path):
+  first = await open_spool(tmp_path)
+  await first.append(MESSAGE)
+
+  second = await open_spool(tmp_path, shared=False)
+  try:
+    assert len(await second.pending()) == 1
+  finally:
+    await first.close()
+    await second.close()
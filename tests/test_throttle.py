@@ -0,0 +1,83 @@
+"""
+Throttling of noisy events into digests
+"""
+
+import asyncio
+
+import pytest
+from conftest import logger
+
+from pydisgit.delivery import Delivery
+from pydisgit.throttle import Throttle, ThrottleRule, parse_rules
+
+pytestmark = pytest.mark.anyio
+
+
+def star(sender: str) -> dict:
+  return {"embeds": [{"title": "New star added", "author": {"name": sender}}]}
+
+
+def make_throttle(burst: int = 2, window: float = 0.1, max_keys: int = 16) -> tuple[Throttle, list[Delivery]]:
+  digests = []
+
+  async def sink(delivery: Delivery) -> None:
+    digests.append(delivery)
+
+  return Throttle({"star": ThrottleRule(burst, window)}, sink, logger, max_keys), digests
+
+
+def test_parse_rules():
+  assert parse_rules({"star": {"burst": 3, "window": 600}}) == {"star": ThrottleRule(3, 600.0)}
+  assert parse_rules(None) == {}
+  with pytest.raises(ValueError):
+    parse_rules({"star": {"burst": 3}})
+  with pytest.raises(ValueError):
+    parse_rules({"star": {"burst": 0, "window": 600}})
+
+
+async def test_burst_is_sent_and_the_rest_digested():
+  throttle, digests = make_throttle()
+
+  admitted = [throttle.admit("1", "a", "KyoriPowered/adventure", "star", star(f"user{i}")) for i in range(5)]
+  assert admitted == [True, True, False, False, False]
+  assert throttle.admit("1", "a", "KyoriPowered/adventure", "push", {}) is True
+  assert digests == []
+
+  await asyncio.sleep(0.2)
+
+  assert len(digests) == 1
+  embed = digests[0].body["embeds"][0]
+  assert (digests[0].hook_id, digests[0].token) == ("1", "a")
+  assert embed["title"] == "[KyoriPowered/adventure] 3 new stars in the last second"
+  assert embed["description"] == "From user2, user3, user4"
+
+
+async def test_buckets_are_per_webhook_and_repository():
+  throttle, _ = make_throttle(burst=1)
+
+  assert throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("a")) is True
+  assert throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("a")) is False
+  assert throttle.admit("2", "b", "KyoriPowered/adventure", "star", star("a")) is True
+  assert throttle.admit("1", "a", "KyoriPowered/adventure-platform", "star", star("a")) is True
+  await throttle.stop()
+
+
+async def test_evicted_bucket_sends_its_digest_early():
+  throttle, digests = make_throttle(burst=1, window=60, max_keys=1)
+
+  throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("a"))
+  throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("b"))
+  throttle.admit("1", "a", "KyoriPowered/adventure-platform", "star", star("c"))
+  await asyncio.sleep(0)
+
+  assert [d.body["embeds"][0]["title"] for d in digests] == ["[KyoriPowered/adventure] 1 new star in the last second"]
+
+
+async def test_stop_sends_pending_digests():
+  throttle, digests = make_throttle(burst=1, window=60)
+
+  throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("a"))
+  throttle.admit("1", "a", "KyoriPowered/adventure", "star", star("b"))
+  await throttle.stop()
+
+  assert len(digests) == 1